@@ -0,0 +1,89 @@
+"""Compare the memory of idle channels held as recorders with the compact channel store.
+
+Also polls every channel of the store once, as offline, and reports the time spent recreating a recorder and
+the number of metric series left behind, which must not grow with the number of channels.
+
+Run from the project directory: python -m benchmarks.bench_channel_state [channels]
+"""
+
+import asyncio
+import sys
+import time
+import tracemalloc
+
+import utils.config as config
+from recorders.channels import ChannelStore
+from recorders.recorder import Pandalive
+from utils.metrics import registry
+
+USER = {
+    config.KEY_PLATFORM: "Pandalive",
+    config.KEY_INTERVAL: 30,
+    config.KEY_FORMAT: "mp4",
+    config.KEY_OUTPUT: "output",
+    config.KEY_HEADERS: dict(config.DEFAULT_HEADERS),
+}
+
+
+def make_users(channels):
+    # Every channel gets its own copy of the options, as the JSON configuration produces
+    return [{**USER, config.KEY_HEADERS: dict(USER[config.KEY_HEADERS]), config.KEY_ID: f"channel{i:06d}"} for i in range(channels)]
+
+
+def create_recorders(users):
+    return [Pandalive(user) for user in users]
+
+
+def create_store(users):
+    store = ChannelStore()
+    for user in users:
+        store.add(Pandalive, user)
+    return store
+
+
+class OfflinePandalive(Pandalive):
+    async def prepare(self):
+        pass
+
+    async def run(self):
+        self.scheduler.add_request()
+        self.scheduler.observe(False)
+
+
+async def poll_store(store, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for state in store.channels:
+            await store.poll(state)
+    return (time.perf_counter() - started) / rounds / len(store.channels)
+
+
+def count_series():
+    return sum(len(metric.items()) for metric in list(registry.values()))
+
+
+def measure(func, channels):
+    users = make_users(channels)
+    tracemalloc.start()
+    result = func(users)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size / channels
+
+
+def main():
+    channels = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    for name, func in (("recorders", create_recorders), ("channel store", create_store)):
+        print(f"channels: {channels}, {name}: {measure(func, channels):.0f} B per idle channel")
+
+    store = ChannelStore()
+    for user in make_users(channels):
+        store.add(OfflinePandalive, user)
+    asyncio.run(poll_store(store, 1))
+    per_poll = asyncio.run(poll_store(store, 3))
+    print(f"channels: {channels}, idle poll through the store: {per_poll * 1e6:.0f} us, loaded recorders: {len(store.loaded())}, metric series: {count_series()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Compare event loop lag with blocking work inline and in the bounded executor.
+
+Run from the project directory: python -m benchmarks.bench_loop_lag [channels] [seconds]
+"""
+
+import asyncio
+import random
+import sys
+import time
+
+from benchmarks.fixtures import make_profile_page, parse_room_id_soup
+from utils.executor import LoopLagMonitor, run_blocking
+
+RESOLVE_TIME = 0.2  # Simulated blocking plugin resolution
+
+
+def resolve_stream(url):
+    time.sleep(RESOLVE_TIME)
+    return {"best": url}
+
+
+async def channel(page, offload, interval):
+    await asyncio.sleep(random.uniform(0, interval))
+    while True:
+        if offload:
+            await run_blocking(parse_room_id_soup, page)
+            if random.random() < 0.01:
+                await run_blocking(resolve_stream, "https://example.com")
+        else:
+            parse_room_id_soup(page)
+            if random.random() < 0.01:
+                resolve_stream("https://example.com")
+        await asyncio.sleep(interval)
+
+
+async def measure(channels, seconds, offload):
+    page = make_profile_page()
+    monitor = LoopLagMonitor(interval=0.1, warning=float("inf"))
+    tasks = [asyncio.create_task(channel(page, offload, 10)) for _ in range(channels)]
+    tasks.append(asyncio.create_task(monitor.start()))
+    await asyncio.sleep(seconds)
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return monitor.max_lag
+
+
+def main():
+    channels = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    seconds = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    for offload in (False, True):
+        max_lag = asyncio.run(measure(channels, seconds, offload))
+        print(f"channels: {channels}, offload: {offload}, max loop lag: {max_lag:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
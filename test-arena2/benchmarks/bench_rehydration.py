@@ -0,0 +1,57 @@
+"""Compare the streaming room ID extractor with the BeautifulSoup full-page parse.
+
+Run from the project directory: python -m benchmarks.bench_rehydration [page.html ...]
+Without arguments a synthetic profile page is used; pass saved TikTok profile pages for real numbers.
+"""
+
+import sys
+import time
+import tracemalloc
+
+from benchmarks.fixtures import make_profile_page, parse_room_id_soup
+from utils.rehydration import RoomIdExtractor
+
+CHUNK_SIZE = 16 * 1024
+ITERATIONS = 20
+
+
+def extract_streaming(body: bytes):
+    extractor = RoomIdExtractor()
+    for i in range(0, len(body), CHUNK_SIZE):
+        if extractor.feed(body[i : i + CHUNK_SIZE]):
+            break
+    return extractor.room_id
+
+
+def extract_soup(body: bytes):
+    return parse_room_id_soup(body.decode("utf-8"))
+
+
+def measure(func, body):
+    started = time.process_time()
+    for _ in range(ITERATIONS):
+        result = func(body)
+    cpu = (time.process_time() - started) / ITERATIONS
+
+    tracemalloc.start()
+    func(body)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, cpu, peak
+
+
+def main():
+    if len(sys.argv) > 1:
+        pages = {path: open(path, "rb").read() for path in sys.argv[1:]}
+    else:
+        pages = {"synthetic": make_profile_page().encode()}
+
+    for name, body in pages.items():
+        print(f"{name} ({len(body) / 1024:.0f} KiB)")
+        for label, func in (("BeautifulSoup", extract_soup), ("streaming", extract_streaming)):
+            room_id, cpu, peak = measure(func, body)
+            print(f"  {label:>13}: room ID {room_id!r}, {cpu * 1000:.2f} ms CPU per call, {peak / 1024:.0f} KiB peak allocations")
+
+
+if __name__ == "__main__":
+    main()
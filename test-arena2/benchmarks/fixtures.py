@@ -0,0 +1,37 @@
+import json
+
+from bs4 import BeautifulSoup
+
+
+def make_profile_page(room_id="7400000000000000000", size=400 * 1024):
+    """Build a page shaped like a TikTok profile, padded to roughly the given size."""
+    data = {
+        "__DEFAULT_SCOPE__": {
+            "webapp.app-context": {"language": "en", "region": "KR"},
+            "webapp.user-detail": {
+                "userInfo": {
+                    "user": {"id": "1", "uniqueId": "user", "nickname": "user", "roomId": room_id},
+                    "stats": {"followerCount": 0, "videoCount": 0},
+                },
+            },
+        }
+    }
+    filler = "".join(f'<div class="item-{i}"><a href="/video/{i}">video {i}</a></div>\n' for i in range(size // 60))
+    return (
+        "<!DOCTYPE html><html><head><title>user | TikTok</title>"
+        + '<script id="SIGI_STATE" type="application/json">{}</script>'
+        + "</head><body>"
+        + filler
+        + f'<script id="__UNIVERSAL_DATA_FOR_REHYDRATION__" type="application/json">{json.dumps(data, separators=(",", ":"))}</script>'
+        + "</body></html>"
+    )
+
+
+def parse_room_id_soup(text):
+    """The full-page parse the recorders used before switching to RoomIdExtractor."""
+    soup = BeautifulSoup(text, "html.parser")
+    script_tag = soup.find("script", id="__UNIVERSAL_DATA_FOR_REHYDRATION__")
+    if not script_tag:
+        return None
+    json_data = json.loads(script_tag.string)
+    return json_data.get("__DEFAULT_SCOPE__", {}).get("webapp.user-detail", {}).get("userInfo", {}).get("user", {}).get("roomId") or ""
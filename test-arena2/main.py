@@ -1,8 +1,10 @@
 import asyncio
 
+import utils.config as config
 import utils.utils as utils
+from recorders.postprocess import postprocess_queue
 from recorders.recorder import *
-from recorders.recorder import recording
+from recorders.registry import recordings
 from utils.utils import logutil
 
 
@@ -10,13 +12,14 @@ async def run():
     args = utils.parse_args()
     try:
         platform = globals()[args.get("platform")]
+        # One process runs per channel from the same directory, each keeps its own post-processing queue
+        postprocess_queue.configure({config.KEY_POSTPROCESS_QUEUE: f"postprocess_{args.get('platform')}_{args.get('id')}.json"})
+        postprocess_queue.start()
         coroutine = platform(args).start()
         await coroutine
     except (asyncio.CancelledError, KeyboardInterrupt, SystemExit):
         logutil.warning("The user has interrupted the recording. Closing the live stream.")
-        for stream_fd, output in recording.copy().values():
-            stream_fd.close()
-            output.close()
+        recordings.close_all()
 
 
 def main():
@@ -0,0 +1,26 @@
+import asyncio
+
+import utils.utils as utils
+from recorders.registry import recordings
+from recorders.runner import MultiRecorder
+from utils.utils import logutil
+
+
+async def run():
+    args = utils.parse_multi_args()
+    try:
+        runner = MultiRecorder.from_file(args.get("config"), memory_report_interval=args.get("memory_report"), metrics_port=args.get("metrics_port"))
+        await runner.run()
+    except ValueError as e:
+        logutil.error(f"Failed to load the configuration: {e}")
+    except (asyncio.CancelledError, KeyboardInterrupt, SystemExit):
+        logutil.warning("The user has interrupted the recording. Closing the live stream.")
+        recordings.close_all()
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import asyncio
+import heapq
+import sys
+import time
+from array import array
+
+import utils.config as config
+from utils.clients import freeze
+from utils.scheduler import HOURS_PER_WEEK
+from utils.utils import logutil
+
+UNKNOWN, OFFLINE, LIVE = -1, 0, 1
+
+
+def freeze_option(value):
+    if isinstance(value, list):
+        return tuple(freeze_option(item) for item in value)
+    return freeze(value)
+
+
+class ChannelProfile:
+    """Options shared by every channel configured alike: platform, headers, cookies, proxy and output settings."""
+
+    __slots__ = ("platform", "options", "prepared")
+
+    def __init__(self, platform, options: dict):
+        self.platform = platform
+        self.options = options
+        self.prepared = False
+
+
+class ChannelState:
+    """What is kept of a channel between polls. Its timestamps live in the store's arrays at its index."""
+
+    __slots__ = ("index", "id", "name", "profile", "recorder", "prepared")
+
+    def __init__(self, index, id, name, profile):
+        self.index = index
+        self.id = id
+        self.name = name
+        self.profile = profile
+        self.recorder = None
+        self.prepared = False
+
+
+class ChannelStore:
+    """Compact state of every configured channel, polled from one dispatch loop.
+
+    A channel's recorder, with its scheduler, breaker and journal, exists only while the channel is being polled,
+    is live or is failing. Once it goes idle again the poll state it needs is written back to the arrays and the
+    recorder is dropped, so an idle channel costs one slotted object and a few array entries. The broadcast start
+    counts of channels with a history are kept as well, so a new recorder does not read the history file again.
+    """
+
+    def __init__(self, on_create=None):
+        self.on_create = on_create
+        self.channels = []
+        self.profiles = {}
+        self.values = {}
+        self.next_poll = array("d")
+        self.last_poll = array("d")
+        self.last_change = array("d")
+        self.live = array("b")
+        self.requests = array("L")
+        self.starts = {}
+        self.heap = []
+        self.tasks = set()
+        self.wakeup = asyncio.Event()
+
+    def __len__(self):
+        return len(self.channels)
+
+    def intern(self, key, value):
+        # Identical headers and cookies are shared by every profile that uses them
+        if not isinstance(value, (dict, list)):
+            return sys.intern(value) if isinstance(value, str) else value
+        return self.values.setdefault((key, freeze_option(value)), value)
+
+    def profile(self, platform, user: dict) -> ChannelProfile:
+        options = {key: self.intern(key, value) for key, value in user.items() if key not in (config.KEY_ID, config.KEY_NAME)}
+        key = (platform, tuple(sorted((key, freeze_option(value)) for key, value in options.items())))
+        if key not in self.profiles:
+            self.profiles[key] = ChannelProfile(platform, options)
+        return self.profiles[key]
+
+    def add(self, platform, user: dict) -> ChannelState:
+        id = sys.intern(str(user.get(config.KEY_ID)))
+        name = sys.intern(str(user.get(config.KEY_NAME, id)))
+        state = ChannelState(len(self.channels), id, name, self.profile(platform, user))
+        self.channels.append(state)
+        self.next_poll.append(0)
+        self.last_poll.append(0)
+        self.last_change.append(time.time())
+        self.live.append(UNKNOWN)
+        self.requests.append(0)
+        heapq.heappush(self.heap, (0, state.index))
+        return state
+
+    def loaded(self):
+        return [state for state in self.channels if state.recorder]
+
+    def total_requests(self) -> int:
+        return sum(self.requests) + sum(state.recorder.scheduler.requests for state in self.loaded())
+
+    async def acquire(self, state: ChannelState):
+        """Return the channel's recorder, creating it with the poll state saved when it was last released."""
+        if state.recorder:
+            return state.recorder
+        profile = state.profile
+        index = state.index
+        # The first recorder of a channel reads its broadcast history from disk
+        starts = self.starts.get(index, array("I", [0] * HOURS_PER_WEEK)) if state.prepared else None
+        recorder = profile.platform({**profile.options, config.KEY_ID: state.id, config.KEY_NAME: state.name}, starts)
+        if self.live[index] != UNKNOWN:
+            recorder.scheduler.live = bool(self.live[index])
+            recorder.scheduler.last_poll = self.last_poll[index]
+            recorder.scheduler.last_change = self.last_change[index]
+        recorder.scheduler.requests = self.requests[index]
+        if self.on_create:
+            self.on_create(recorder)
+        state.recorder = recorder
+
+        if not state.prepared:
+            state.prepared = True
+            await recorder.prepare()
+            # Names resolved by the platform are kept so the next recorder starts with them
+            state.id = sys.intern(str(recorder.id))
+            state.name = sys.intern(str(recorder.name))
+        if not profile.prepared:
+            profile.prepared = True
+            profile.options[config.KEY_COOKIES] = recorder.cookies
+        return recorder
+
+    def release(self, state: ChannelState):
+        recorder = state.recorder
+        index = state.index
+        if recorder.scheduler.live is not None:
+            self.live[index] = LIVE if recorder.scheduler.live else OFFLINE
+            self.last_poll[index] = recorder.scheduler.last_poll
+            self.last_change[index] = recorder.scheduler.last_change
+        self.requests[index] = recorder.scheduler.requests
+        if any(recorder.scheduler.starts):
+            self.starts[index] = recorder.scheduler.starts
+        else:
+            self.starts.pop(index, None)
+        recorder.release()
+        state.recorder = None
+
+    def schedule(self, state: ChannelState, delay):
+        self.next_poll[state.index] = time.monotonic() + delay
+        heapq.heappush(self.heap, (self.next_poll[state.index], state.index))
+        self.wakeup.set()
+
+    async def poll(self, state: ChannelState):
+        try:
+            recorder = await self.acquire(state)
+        except Exception as e:
+            logutil.error(f"[{state.profile.options.get(config.KEY_PLATFORM)}][{state.name}]", f"Failed to create the recorder: {e}")
+            self.schedule(state, state.profile.options.get(config.KEY_INTERVAL, config.DEFAULT_INTERVAL))
+            return
+        delay = await recorder.poll()
+        if recorder.is_idle():
+            self.release(state)
+        self.schedule(state, delay)
+
+    def spawn(self, state: ChannelState):
+        task = asyncio.create_task(self.poll(state))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def start(self):
+        try:
+            while True:
+                now = time.monotonic()
+                while self.heap and self.heap[0][0] <= now:
+                    _, index = heapq.heappop(self.heap)
+                    self.spawn(self.channels[index])
+                self.wakeup.clear()
+                # A timer instead of wait_for, which can swallow a cancellation racing the wakeup
+                timer = asyncio.get_running_loop().call_at(self.heap[0][0], self.wakeup.set) if self.heap else None
+                try:
+                    await self.wakeup.wait()
+                finally:
+                    if timer:
+                        timer.cancel()
+        finally:
+            for task in list(self.tasks):
+                task.cancel()
+            await asyncio.gather(*self.tasks, return_exceptions=True)
@@ -0,0 +1,359 @@
+import asyncio
+import hashlib
+import re
+import time
+from collections import deque, namedtuple
+from urllib.parse import urljoin, urlsplit, urlunsplit
+
+import utils.config as config
+from utils.clients import clients
+from utils.metrics import counter, gauge, histogram
+from utils.utils import logutil
+
+Segment = namedtuple("Segment", ["sequence", "uri", "duration"])
+
+segment_latency = histogram("hls_segment_download_seconds", "Time to download one HLS segment")
+reload_lag = histogram("hls_playlist_reload_lag_seconds", "Delay of playlist reloads past their scheduled time")
+segment_bytes = counter("hls_segment_bytes_total", "Bytes downloaded by the native HLS engine")
+dedup_segments = counter("hls_dedup_segments_total", "Segments skipped after a reconnect because they were already written")
+dedup_seconds = counter("hls_dedup_seconds_total", "Media seconds not downloaded again after a reconnect")
+dedup_bytes = counter("hls_dedup_bytes_total", "Bytes of duplicate segments not written again")
+hedged_requests = counter("hls_hedged_requests_total", "Segment downloads duplicated to an alternate edge, by winner")
+stall_seconds = counter("hls_stall_seconds_total", "Time the writer waited on segment downloads beyond the segment duration")
+queue_depth = gauge("hls_queue_depth", "Segments queued or downloading ahead of the writer")
+recorded_seconds = counter("hls_recorded_seconds_total", "Media seconds written by the native HLS engine")
+
+ATTRIBUTE_PATTERN = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+def parse_attributes(value) -> dict:
+    return {key: value.strip('"') for key, value in ATTRIBUTE_PATTERN.findall(value)}
+
+
+class Playlist:
+    def __init__(self):
+        self.target_duration = 0
+        self.segments = []
+        self.variants = []
+        self.map_uri = None
+        self.encrypted = False
+        self.ended = False
+
+
+def parse_playlist(text, base_url) -> Playlist:
+    playlist = Playlist()
+    sequence = 0
+    duration = 0
+    variant = None
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("#EXT-X-TARGETDURATION:"):
+            playlist.target_duration = float(line.split(":", 1)[1])
+        elif line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            sequence = int(line.split(":", 1)[1])
+        elif line.startswith("#EXTINF:"):
+            duration = float(line.split(":", 1)[1].split(",")[0])
+        elif line.startswith("#EXT-X-ENDLIST"):
+            playlist.ended = True
+        elif line.startswith("#EXT-X-MAP:"):
+            playlist.map_uri = urljoin(base_url, parse_attributes(line.split(":", 1)[1]).get("URI", ""))
+        elif line.startswith("#EXT-X-KEY:"):
+            playlist.encrypted = parse_attributes(line.split(":", 1)[1]).get("METHOD", "NONE") != "NONE"
+        elif line.startswith("#EXT-X-STREAM-INF:"):
+            variant = int(parse_attributes(line.split(":", 1)[1]).get("BANDWIDTH", 0))
+        elif line.startswith("#"):
+            continue
+        elif variant is not None:
+            playlist.variants.append((variant, urljoin(base_url, line)))
+            variant = None
+        else:
+            playlist.segments.append(Segment(sequence, urljoin(base_url, line), duration))
+            sequence += 1
+    return playlist
+
+
+class SegmentHistory:
+    """Media sequence and content hashes of the segments written for one broadcast, kept across reconnects."""
+
+    def __init__(self, url, window=config.DEFAULT_DEDUP_WINDOW):
+        self.url = url
+        self.last_sequence = -1
+        self.hashes = deque(maxlen=window)
+        self.updated = time.monotonic()
+
+    def is_recent(self, url) -> bool:
+        return url == self.url and time.monotonic() - self.updated < config.DEFAULT_DEDUP_MAX_AGE
+
+    def seen(self, data) -> bool:
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        if digest in self.hashes:
+            return True
+        self.hashes.append(digest)
+        return False
+
+    def written(self, sequence):
+        self.last_sequence = sequence
+        self.updated = time.monotonic()
+
+
+class EdgeSelector:
+    """Score the CDN edges serving a stream by segment latency and pick one to download from.
+
+    The current edge is kept until another one is clearly faster, so connections stay warm. The hedge
+    delay is a percentile of recent segment latencies: a download still running by then is duplicated
+    to an alternate edge and the first response wins.
+    """
+
+    def __init__(self, edges, percentile=config.DEFAULT_HEDGE_PERCENTILE):
+        # Each edge is a (scheme, netloc) pair
+        self.edges = list(dict.fromkeys(edges))
+        self.percentile = percentile
+        self.scores = {}
+        self.latencies = deque(maxlen=config.DEFAULT_HEDGE_WINDOW)
+        self.current = self.edges[0] if self.edges else None
+
+    def add(self, url):
+        parts = urlsplit(url)
+        edge = (parts.scheme, parts.netloc)
+        if edge not in self.edges:
+            self.edges.append(edge)
+            self.current = self.current or edge
+
+    def best(self):
+        scored = [(score, edge) for edge, score in self.scores.items() if edge in self.edges]
+        if scored:
+            score, edge = min(scored)
+            current = self.scores.get(self.current)
+            if current is None or score < current * (1 - config.DEFAULT_EDGE_SWITCH_MARGIN):
+                self.current = edge
+        return self.current
+
+    def alternate(self, edge):
+        others = [other for other in self.edges if other != edge]
+        # Untried edges score 0, so they are tried before slower known ones
+        return min(others, key=lambda other: self.scores.get(other, 0)) if others else None
+
+    def serves(self, url) -> bool:
+        """Whether url is on one of the edges, so it can be rewritten to any other."""
+        parts = urlsplit(url)
+        return (parts.scheme, parts.netloc) in self.edges
+
+    def rewrite(self, url, edge):
+        if not self.serves(url):
+            return url
+        return urlunsplit(urlsplit(url)._replace(scheme=edge[0], netloc=edge[1]))
+
+    def observe(self, edge, latency, error=False):
+        if error:
+            latency = config.DEFAULT_HLS_SEGMENT_TIMEOUT
+        else:
+            self.latencies.append(latency)
+        score = self.scores.get(edge)
+        self.scores[edge] = latency if score is None else score + 0.3 * (latency - score)
+
+    def hedge_delay(self, fallback):
+        if len(self.latencies) < config.DEFAULT_HEDGE_MIN_SAMPLES:
+            return fallback
+        latencies = sorted(self.latencies)
+        return max(latencies[int(self.percentile * (len(latencies) - 1))], config.DEFAULT_HEDGE_MIN_DELAY)
+
+
+class HLSStreamRecorder:
+    """Record an HLS media playlist on the event loop instead of on StreamRunner threads.
+
+    The playlist is reloaded every target duration, up to `prefetch` segments are downloaded in
+    parallel through the shared HTTP/2 clients, and segments are written in media sequence order.
+    A SegmentHistory shared across reconnects makes sure segments already written are neither
+    downloaded nor written again, by media sequence or, failing that, by content.
+    With more than one edge known, slow downloads of segments served from those edges are hedged across them.
+    Segments on another host, such as a separate segment CDN, have no known alternate and are fetched as is.
+    """
+
+    def __init__(self, url, client_key, flag, channel, prefetch=config.DEFAULT_HLS_PREFETCH, history=None, edges=(), hedge=config.DEFAULT_HEDGE):
+        self.url = url
+        self.client_key = client_key
+        self.flag = flag
+        self.channel = channel
+        self.history = history or SegmentHistory(url)
+        self.edges = EdgeSelector([])
+        self.hedge = hedge
+        for edge in (url, *edges):
+            self.edges.add(edge)
+        self.target_duration = config.DEFAULT_HLS_SEGMENT_TIMEOUT
+        self.last_sequence = self.history.last_sequence
+        self.map_uri = None
+        self.queue = asyncio.Queue()
+        self.slots = asyncio.Semaphore(prefetch)
+        self.reloader = None
+        self.error = None
+        self.closed = False
+
+    async def fetch(self, url) -> bytes:
+        for attempt in range(1, config.DEFAULT_HLS_RETRIES + 1):
+            try:
+                # Segment downloads are not polls, so they bypass the per-host rate limits
+                response = await clients.request(self.client_key, "GET", url, rate_limit=False, timeout=config.DEFAULT_HLS_SEGMENT_TIMEOUT)
+                if response.status_code == 200:
+                    return response.content
+                error = f"Status code: {response.status_code}"
+            except Exception as e:
+                error = e
+            if attempt < config.DEFAULT_HLS_RETRIES:
+                await asyncio.sleep(attempt)
+        raise IOError(f"Unable to open URL: {url} ({error})")
+
+    async def load_playlist(self) -> Playlist:
+        playlist = parse_playlist((await self.fetch(self.url)).decode("utf-8"), self.url)
+        if playlist.variants:
+            # Multivariant playlist: follow the highest bandwidth variant
+            bandwidth, self.url = max(playlist.variants)
+            # Variants repeated with the same bandwidth are redundant streams on other edges
+            for variant in playlist.variants:
+                if variant[0] == bandwidth:
+                    self.edges.add(variant[1])
+            playlist = parse_playlist((await self.fetch(self.url)).decode("utf-8"), self.url)
+        if playlist.encrypted:
+            raise ValueError("Encrypted HLS streams are not supported by the native engine.")
+        self.edges.add(self.url)
+        self.target_duration = playlist.target_duration or self.target_duration
+        return playlist
+
+    async def download(self, segment) -> bytes:
+        started = time.monotonic()
+        # Only segments on a known edge can be sent to another one, and only those downloads score the edges
+        if self.hedge and len(self.edges.edges) > 1 and self.edges.serves(segment.uri):
+            data = await self.download_hedged(segment)
+        else:
+            data = await self.fetch(segment.uri)
+        segment_latency.observe(time.monotonic() - started, channel=self.channel)
+        segment_bytes.inc(len(data), channel=self.channel)
+        return data
+
+    async def fetch_from(self, url, edge) -> bytes:
+        started = time.monotonic()
+        try:
+            data = await self.fetch(self.edges.rewrite(url, edge))
+        except Exception:
+            self.edges.observe(edge, 0, error=True)
+            raise
+        self.edges.observe(edge, time.monotonic() - started)
+        return data
+
+    async def download_hedged(self, segment) -> bytes:
+        primary = self.edges.best()
+        tasks = {asyncio.create_task(self.fetch_from(segment.uri, primary)): "primary"}
+        done, _ = await asyncio.wait(tasks, timeout=self.edges.hedge_delay(self.target_duration))
+        if not done or next(iter(done)).exception():
+            alternate = self.edges.alternate(primary)
+            tasks[asyncio.create_task(self.fetch_from(segment.uri, alternate))] = "alternate"
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if not task.exception():
+                        if len(tasks) > 1:
+                            hedged_requests.inc(channel=self.channel, winner=tasks[task])
+                        return task.result()
+            # Every edge failed
+            raise next(iter(tasks)).exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def enqueue(self, segment):
+        # Wait for a free slot so downloads never run more than `prefetch` segments ahead of the writer
+        await self.slots.acquire()
+        self.queue.put_nowait((segment, asyncio.create_task(self.download(segment))))
+        queue_depth.set(self.queue.qsize(), channel=self.channel)
+
+    async def reload_playlists(self):
+        try:
+            last_segment = time.monotonic()
+            next_reload = time.monotonic()
+            first_load = True
+            while not self.closed:
+                reload_lag.observe(max(time.monotonic() - next_reload, 0), channel=self.channel)
+                playlist = await self.load_playlist()
+
+                if playlist.map_uri and playlist.map_uri != self.map_uri:
+                    self.map_uri = playlist.map_uri
+                    await self.enqueue(Segment(None, playlist.map_uri, 0))
+
+                if playlist.segments and playlist.segments[-1].sequence < self.last_sequence:
+                    # The media sequence went backwards, so this is a new broadcast
+                    logutil.warning(self.flag, f"Media sequence restarted at {playlist.segments[0].sequence}")
+                    self.last_sequence = -1
+                elif self.last_sequence >= 0 and first_load:
+                    skipped = [segment for segment in playlist.segments if segment.sequence <= self.last_sequence]
+                    if skipped:
+                        logutil.info(self.flag, f"Skipping {len(skipped)} segments already recorded before the reconnect")
+                        dedup_segments.inc(len(skipped), channel=self.channel, method="sequence")
+                        dedup_seconds.inc(sum(segment.duration for segment in skipped), channel=self.channel)
+                first_load = False
+                segments = [segment for segment in playlist.segments if segment.sequence > self.last_sequence]
+                for segment in segments:
+                    await self.enqueue(segment)
+                    self.last_sequence = segment.sequence
+
+                if playlist.ended:
+                    break
+                if segments:
+                    last_segment = time.monotonic()
+                    delay = playlist.target_duration
+                elif time.monotonic() - last_segment > config.DEFAULT_HLS_SEGMENT_TIMEOUT:
+                    raise TimeoutError(f"No new segments for {config.DEFAULT_HLS_SEGMENT_TIMEOUT} seconds (timeout)")
+                else:
+                    # Unchanged playlist: reload after half the target duration
+                    delay = playlist.target_duration / 2
+                next_reload += max(delay, 1)
+                await asyncio.sleep(max(next_reload - time.monotonic(), 0))
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            self.error = e
+        finally:
+            self.queue.put_nowait(None)
+
+    async def write_segments(self, write):
+        while item := await self.queue.get():
+            segment, task = item
+            queue_depth.set(self.queue.qsize(), channel=self.channel)
+            waited = time.monotonic()
+            try:
+                data = await task
+            except Exception as e:
+                logutil.warning(self.flag, f"Skipping segment {segment.sequence}: {e}")
+                continue
+            finally:
+                self.slots.release()
+                # Waiting longer than the segment lasts falls behind the broadcast
+                stall_seconds.inc(max(time.monotonic() - waited - segment.duration, 0), channel=self.channel)
+            recorded_seconds.inc(segment.duration, channel=self.channel)
+            if segment.sequence is not None and self.history.seen(data):
+                dedup_segments.inc(channel=self.channel, method="hash")
+                dedup_bytes.inc(len(data), channel=self.channel)
+                continue
+            await write(data, segment)
+            if segment.sequence is not None:
+                self.history.written(segment.sequence)
+
+    async def run(self, write):
+        self.reloader = asyncio.create_task(self.reload_playlists())
+        try:
+            await self.write_segments(write)
+        finally:
+            self.close()
+            while not self.queue.empty():
+                if item := self.queue.get_nowait():
+                    item[1].cancel()
+        if self.error:
+            raise self.error
+
+    def close(self):
+        self.closed = True
+        queue_depth.remove(channel=self.channel)
+        if self.reloader:
+            self.reloader.cancel()
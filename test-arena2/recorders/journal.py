@@ -0,0 +1,82 @@
+import json
+import os
+import time
+
+import utils.config as config
+from utils.utils import logutil
+
+
+class RecordingJournal:
+    """On-disk record of a channel's active recording: output file, last media sequence and byte offset on disk.
+
+    It is removed when the recording finishes normally, so one left behind means the process died mid-broadcast
+    and a restarted recorder can append to the same file instead of starting a new one.
+    """
+
+    def __init__(self, platform, id, channel):
+        self.channel = channel
+        self.path = os.path.join(config.DEFAULT_JOURNAL_DIR, f"{platform}_{id}.json")
+        self.entry = None
+
+    def begin(self, url, broadcast, filename, live_time, title, format, part=None):
+        self.entry = {
+            "url": url,
+            "broadcast": broadcast,
+            "filename": str(filename),
+            "live_time": live_time,
+            "title": title,
+            "format": format,
+            "part": part,
+            "sequence": None,
+            "offset": 0,
+            "updated": time.time(),
+        }
+        self.save()
+
+    def checkpoint(self, filename, part, sequence, offset):
+        if not self.entry:
+            return
+        self.entry.update(filename=str(filename), part=part, sequence=sequence, offset=offset, updated=time.time())
+        self.save()
+
+    def resume(self, url, broadcast):
+        """Return the journal entry to append to, or None if there is no recent recording of this broadcast.
+
+        The channel URL is the same for every broadcast, so the platform's broadcast identifier has to match too.
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                entry = json.load(file)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logutil.error(f"[{self.channel}] Failed to load the recording journal: {e}")
+            return None
+        if entry.get("url") != url or entry.get("broadcast") != broadcast or time.time() - entry.get("updated", 0) > config.DEFAULT_JOURNAL_MAX_AGE:
+            return None
+        try:
+            if os.path.getsize(entry["filename"]) < entry["offset"]:
+                return None
+        except OSError:
+            return None
+        logutil.info(f"[{self.channel}] Resuming {os.path.basename(entry['filename'])} at {entry['offset']} bytes, media sequence {entry['sequence']}")
+        return entry
+
+    def finish(self):
+        self.entry = None
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logutil.error(f"[{self.channel}] Failed to remove the recording journal: {e}")
+
+    def save(self):
+        try:
+            os.makedirs(config.DEFAULT_JOURNAL_DIR, exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as file:
+                json.dump(self.entry, file, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            logutil.error(f"[{self.channel}] Failed to save the recording journal: {e}")
@@ -0,0 +1,463 @@
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+import ffmpeg
+from streamlink_cli.output import FileOutput
+
+import utils.config as config
+from utils.disk import can_reserve_space, reserve_space
+from utils.metrics import counter, gauge
+from utils.utils import logutil
+
+MIB = 1024 * 1024
+GIB = 1024 * MIB
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+PAT_PID = 0
+# MPEG-1/2, MPEG-4 Part 2, H.264, H.264 SVC, HEVC and VVC video
+VIDEO_STREAM_TYPES = {0x01, 0x02, 0x10, 0x1B, 0x1F, 0x24, 0x33}
+
+
+def ts_pid(packet) -> int:
+    return (packet[1] & 0x1F) << 8 | packet[2]
+
+
+def ts_payload(packet) -> int:
+    """Offset of the payload in an MPEG-TS packet, past the header and adaptation field."""
+    if packet[3] & 0x20:
+        return 5 + packet[4]
+    return 4
+
+
+def is_random_access(packet) -> bool:
+    # Start of a PES packet flagged as a random access point (a keyframe) in its adaptation field
+    return bool(packet[1] & 0x40 and packet[3] & 0x20 and packet[4] and packet[5] & 0x40)
+
+
+def ts_section(packet) -> bytes:
+    """PSI section starting in a packet, past its pointer field."""
+    start = ts_payload(packet)
+    if start >= len(packet):
+        return b""
+    return packet[start + 1 + packet[start] :]
+
+
+def pmt_pid(packet):
+    """Return the PID of the first program map table listed in a PAT packet, or None."""
+    section = ts_section(packet)
+    if len(section) < 12:
+        return None
+    length = (section[1] & 0x0F) << 8 | section[2]
+    # Program entries follow the 8-byte header and end before the CRC
+    for offset in range(8, min(3 + length - 4, len(section) - 3), 4):
+        if section[offset] << 8 | section[offset + 1]:
+            return (section[offset + 2] & 0x1F) << 8 | section[offset + 3]
+    return None
+
+
+def video_pid(packet):
+    """Return the PID of the first video stream listed in a PMT packet, or None."""
+    section = ts_section(packet)
+    if len(section) < 12:
+        return None
+    length = (section[1] & 0x0F) << 8 | section[2]
+    end = min(3 + length - 4, len(section))
+    # Elementary stream entries follow the 12-byte header and the program descriptors
+    offset = 12 + ((section[10] & 0x0F) << 8 | section[11])
+    while offset + 5 <= end:
+        if section[offset] in VIDEO_STREAM_TYPES:
+            return (section[offset + 1] & 0x1F) << 8 | section[offset + 2]
+        offset += 5 + ((section[offset + 3] & 0x0F) << 8 | section[offset + 4])
+    return None
+
+
+write_syscalls = counter("output_write_syscalls_total", "write() calls made by the recording outputs")
+write_bytes = counter("output_bytes_written_total", "Bytes written by the recording outputs")
+fsync_calls = counter("output_fsync_total", "fsync() calls made by the recording outputs")
+pipe_buffered = gauge("output_pipe_buffered_bytes", "Bytes waiting to be piped into ffmpeg")
+pipe_spilled = counter("output_pipe_spilled_bytes_total", "Bytes spilled to disk while ffmpeg fell behind")
+
+
+class BufferedFileOutput(FileOutput):
+    """File output that coalesces small chunks into large writes.
+
+    Space is preallocated in growth chunks on Linux, past the end of the file so its size stays that of the data
+    written, and the file is synced to disk according to the fsync policy: never, every N MiB ("size") or every
+    N seconds ("time").
+
+    After every flush, checkpoint(filename, sequence, offset) is called with the last media segment
+    that is completely on disk, so a recording can be resumed by appending from resume_offset.
+    on_first_write() is called once, after the first bytes have been written to the file.
+    """
+
+    def __init__(self, filename, channel, buffer_size=config.DEFAULT_WRITE_BUFFER, fsync=config.DEFAULT_FSYNC, fsync_every=config.DEFAULT_FSYNC_EVERY, preallocate=config.DEFAULT_PREALLOCATE, resume_offset=None):
+        super().__init__(filename=filename)
+        if fsync not in config.FSYNC_CHOICES:
+            raise ValueError(f"Invalid fsync policy: {fsync}")
+        self.channel = channel
+        self.buffer_size = buffer_size * MIB
+        self.fsync = fsync
+        self.fsync_every = fsync_every
+        self.preallocate = preallocate * MIB if can_reserve_space() else 0
+        self.buffer = bytearray()
+        self.part = None
+        self.resume_offset = resume_offset
+        self.bytes_written = 0
+        self.checkpoint = None
+        self.on_first_write = None
+        self.segment_ends = deque()
+        self.segmented = False
+
+    def _open(self):
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        self.position = 0
+        if self.resume_offset is not None:
+            # Drop whatever was written after the last checkpoint and append from there
+            self.fd = open(self.filename, "r+b", buffering=0)
+            self.fd.truncate(self.resume_offset)
+            self.position = self.fd.seek(self.resume_offset)
+        else:
+            self.fd = open(self.filename, "wb", buffering=0)
+        self.allocated = self.position
+        self.synced_position = self.position
+        self.syscalls = 0
+        self.segment_ends.clear()
+        self.opened_time = self.synced_time = time.monotonic()
+
+    def write_segment(self, data, sequence=None):
+        """Write one whole media segment, or the initialization section when sequence is None."""
+        self.segmented = True
+        if sequence is None and self.resume_offset:
+            # The resumed file already starts with the initialization section
+            self.resume_offset = None
+            return
+        self.write(data)
+        if sequence is not None:
+            self.segment_ends.append((sequence, self.position + len(self.buffer)))
+            self.report_checkpoint()
+
+    def report_checkpoint(self):
+        if not self.checkpoint:
+            return
+        if not self.segmented:
+            self.checkpoint(self.filename, None, self.position)
+            return
+        last = None
+        while self.segment_ends and self.segment_ends[0][1] <= self.position:
+            last = self.segment_ends.popleft()
+        if last:
+            self.checkpoint(self.filename, *last)
+
+    def _write(self, data):
+        self.bytes_written += len(data)
+        self.buffer += data
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        self.reserve(self.position + len(self.buffer))
+        view = memoryview(self.buffer)
+        while view:
+            written = self.fd.write(view)
+            self.syscalls += 1
+            write_syscalls.inc(channel=self.channel)
+            write_bytes.inc(written, channel=self.channel)
+            view = view[written:]
+        view.release()
+        self.position += len(self.buffer)
+        self.buffer.clear()
+        if self.on_first_write:
+            self.on_first_write()
+            self.on_first_write = None
+        self.sync_if_due()
+        self.report_checkpoint()
+
+    def reserve(self, size):
+        if not self.preallocate or size <= self.allocated:
+            return
+        try:
+            length = size - self.allocated + self.preallocate
+            reserve_space(self.fd.fileno(), self.allocated, length)
+            self.allocated += length
+        except OSError:
+            # Not supported by this file system
+            self.preallocate = 0
+
+    def sync_if_due(self):
+        if self.fsync == "size" and self.position - self.synced_position >= self.fsync_every * MIB:
+            self.sync()
+        elif self.fsync == "time" and time.monotonic() - self.synced_time >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        os.fsync(self.fd.fileno())
+        fsync_calls.inc(channel=self.channel)
+        self.synced_position = self.position
+        self.synced_time = time.monotonic()
+
+    def _close(self):
+        try:
+            self.flush()
+            # Release the blocks reserved past the end of the recording, truncating to the same size frees them
+            if self.allocated > self.position:
+                self.fd.truncate(self.position)
+            if self.fsync != "never":
+                self.sync()
+        finally:
+            self.fd.close()
+        elapsed = max(time.monotonic() - self.opened_time, 1e-9)
+        if self.syscalls:
+            logutil.info(f"[{self.channel}] {self.syscalls} writes, {self.position / self.syscalls / 1024:.0f} KiB per write, {self.syscalls / elapsed:.2f} writes/s")
+
+
+class SegmentedFileOutput(BufferedFileOutput):
+    """Buffered output that rolls over to a new sequence-numbered file every segment_time minutes or segment_size GiB.
+
+    Writers that know the media segment boundaries call write_segment() and parts are cut between segments,
+    with the initialization section repeated at the start of each part. Otherwise MPEG-TS is cut before the
+    next video keyframe, or before the next PAT if the stream does not flag its keyframes, and each part starts with the
+    latest PAT and PMT so it can be decoded on its own. Each closed part is handed to on_part_closed(filename, part)
+    so it can be processed straight away.
+    """
+
+    def __init__(self, namer, channel, segment_time=config.DEFAULT_SEGMENT_TIME, segment_size=config.DEFAULT_SEGMENT_SIZE, packet_size=TS_PACKET_SIZE, on_part_closed=None, part=1, **kwargs):
+        super().__init__(namer(part), channel, **kwargs)
+        self.namer = namer
+        self.segment_time = segment_time * 60
+        self.segment_size = segment_size * GIB
+        self.packet_size = packet_size
+        self.on_part_closed = on_part_closed
+        self.part = part
+        self.header = b""
+        self.stream_position = 0
+        self.pat = b""
+        self.pmt = b""
+        self.pmt_pid = None
+        self.video_pid = None
+        self.random_access = False
+
+    def rollover_due(self):
+        if self.segment_time and time.monotonic() - self.opened_time >= self.segment_time:
+            return True
+        return bool(self.segment_size) and self.position + len(self.buffer) >= self.segment_size
+
+    def rollover(self):
+        closed = self.filename
+        self._close()
+        self.part += 1
+        self.filename = self.namer(self.part, rollover=True)
+        self.resume_offset = None
+        self._open()
+        if self.header:
+            super()._write(self.header)
+        logutil.info(f"[{self.channel}] Started part {self.part}: {self.filename.name}")
+        if self.on_part_closed:
+            self.on_part_closed(closed, self.part - 1)
+
+    def write_segment(self, data, sequence=None):
+        if sequence is None:
+            self.header = bytes(data)
+        elif self.rollover_due():
+            self.rollover()
+        super().write_segment(data, sequence)
+
+    def packets(self, data):
+        """Offsets of the complete MPEG-TS packets in data."""
+        for offset in range(-self.stream_position % self.packet_size, len(data) - self.packet_size + 1, self.packet_size):
+            if data[offset] == TS_SYNC_BYTE:
+                yield offset
+
+    def track_tables(self, data):
+        # Only look for the tables in chunks that can hold them, the rest of the stream is not parsed
+        if data.find(b"\x47\x40\x00") < 0 and not (self.pmt_pid and data.find(bytes((TS_SYNC_BYTE, 0x40 | self.pmt_pid >> 8, self.pmt_pid & 0xFF))) >= 0):
+            return
+        for offset in self.packets(data):
+            packet = bytes(data[offset : offset + self.packet_size])
+            if not packet[1] & 0x40:
+                continue
+            pid = ts_pid(packet)
+            if pid == PAT_PID:
+                self.pat = packet
+                self.pmt_pid = pmt_pid(packet)
+            elif pid == self.pmt_pid:
+                self.pmt = packet
+                self.video_pid = video_pid(packet)
+        if self.pat and self.pmt:
+            self.header = self.pat + self.pmt
+
+    def is_keyframe_stream(self, pid) -> bool:
+        # Every audio frame is flagged as a random access point, so only the video stream's keyframes count.
+        # Streams without video are cut on any of them, and none are trusted before the PMT is known
+        if self.video_pid is not None:
+            return pid == self.video_pid
+        return bool(self.pmt)
+
+    def find_cut(self, data):
+        for offset in self.packets(data):
+            packet = data[offset : offset + 6]
+            if is_random_access(packet) and self.is_keyframe_stream(ts_pid(packet)):
+                self.random_access = True
+                return offset
+            if not self.random_access and packet[1] & 0x40 and ts_pid(packet) == PAT_PID:
+                return offset
+        return None
+
+    def _write(self, data):
+        if not self.segmented and self.packet_size:
+            cut = self.find_cut(data) if self.rollover_due() else None
+            if cut is not None:
+                self.track_tables(data[:cut])
+                super()._write(data[:cut])
+                self.stream_position += cut
+                data = data[cut:]
+                self.rollover()
+            self.track_tables(data)
+        super()._write(data)
+        self.stream_position += len(data)
+
+
+class SpillBuffer:
+    """FIFO of chunks kept in memory up to a limit and spilled to a temporary file beyond it.
+
+    Once spilling starts, new data keeps going to the file until the reader has drained it, so the order is kept.
+    """
+
+    def __init__(self, limit, directory, channel):
+        self.limit = limit
+        self.directory = directory
+        self.channel = channel
+        self.chunks = deque()
+        self.size = 0
+        self.spill = None
+        self.spill_read = 0
+        self.spill_write = 0
+        self.spilled = False
+        self.closed = False
+        self.condition = threading.Condition()
+
+    def put(self, data):
+        with self.condition:
+            if self.spill is None and self.size + len(data) <= self.limit:
+                self.chunks.append(bytes(data))
+                self.size += len(data)
+            else:
+                if self.spill is None:
+                    self.spill = tempfile.TemporaryFile(dir=self.directory, prefix=".spill-")
+                if not self.spilled:
+                    self.spilled = True
+                    logutil.warning(f"[{self.channel}] ffmpeg is falling behind, spilling the stream to disk")
+                self.spill.seek(self.spill_write)
+                self.spill.write(data)
+                self.spill_write += len(data)
+                pipe_spilled.inc(len(data), channel=self.channel)
+            pipe_buffered.set(self.size + self.spill_write - self.spill_read, channel=self.channel)
+            self.condition.notify()
+
+    def get(self):
+        """Return the next chunk, waiting for one, or None once the buffer is closed and drained."""
+        with self.condition:
+            while not self.chunks and self.spill is None and not self.closed:
+                self.condition.wait()
+            if self.chunks:
+                data = self.chunks.popleft()
+                self.size -= len(data)
+            elif self.spill is not None:
+                self.spill.seek(self.spill_read)
+                data = self.spill.read(min(self.spill_write - self.spill_read, MIB))
+                self.spill_read += len(data)
+                if self.spill_read == self.spill_write:
+                    self.spill.close()
+                    self.spill = None
+                    self.spill_read = self.spill_write = 0
+            else:
+                return None
+            pipe_buffered.set(self.size + self.spill_write - self.spill_read, channel=self.channel)
+            return data
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+    def discard(self):
+        with self.condition:
+            self.chunks.clear()
+            self.size = 0
+            if self.spill is not None:
+                self.spill.close()
+                self.spill = None
+            pipe_buffered.remove(channel=self.channel)
+
+
+class FFmpegOutput(FileOutput):
+    """Output that remuxes the stream into its final container through ffmpeg while recording.
+
+    MP4 is written as fragmented MP4, so the file is playable as it grows and needs no post-pass.
+    A writer thread feeds ffmpeg from a SpillBuffer, so a slow ffmpeg never stalls the stream reader.
+    on_first_write() is called once, after the first bytes have been handed to ffmpeg.
+    """
+
+    def __init__(self, filename, channel, format="mp4", buffer_size=config.DEFAULT_PIPE_BUFFER):
+        super().__init__(filename=filename)
+        self.channel = channel
+        self.format = format
+        self.buffer_size = buffer_size * MIB
+        self.buffer = None
+        self.process = None
+        self.writer = None
+        self.error = None
+        self.bytes_written = 0
+        self.part = None
+        self.on_first_write = None
+
+    def _open(self):
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        options = {"format": self.format, "codec": "copy", "map_metadata": "-1"}
+        if self.format == "mp4":
+            options["movflags"] = config.MP4_FRAGMENT_FLAGS
+        self.process = (
+            ffmpeg.input("pipe:")
+            .output(str(self.filename), **options)
+            .global_args("-hide_banner", "-loglevel", "error")
+            .overwrite_output()
+            .run_async(pipe_stdin=True)
+        )
+        self.buffer = SpillBuffer(self.buffer_size, self.filename.parent, self.channel)
+        self.writer = threading.Thread(target=self.feed, name=f"ffmpeg-{self.channel}", daemon=True)
+        self.writer.start()
+
+    def feed(self):
+        try:
+            while (data := self.buffer.get()) is not None:
+                self.process.stdin.write(data)
+                if self.on_first_write:
+                    self.on_first_write()
+                    self.on_first_write = None
+        except OSError:
+            self.error = OSError(f"ffmpeg exited with code {self.process.poll()}")
+            self.buffer.discard()
+
+    def write_segment(self, data, sequence=None):
+        self.write(data)
+
+    def _write(self, data):
+        if self.error:
+            raise self.error
+        self.bytes_written += len(data)
+        self.buffer.put(data)
+
+    def _close(self):
+        self.buffer.close()
+        self.writer.join()
+        self.buffer.discard()
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        if returncode := self.process.wait():
+            logutil.error(f"[{self.channel}] ffmpeg exited with code {returncode}: {self.filename.name}")
@@ -0,0 +1,174 @@
+import heapq
+import itertools
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+
+import ffmpeg
+
+import utils.config as config
+from utils.metrics import counter, gauge, histogram
+from utils.utils import logutil
+
+queue_length = gauge("postprocess_queue_length", "Post-processing jobs waiting or running")
+jobs_running = gauge("postprocess_running", "Post-processing jobs running")
+job_duration = histogram("postprocess_duration_seconds", "Time spent running a post-processing job", buckets=(10, 30, 60, 120, 300, 600, 1200, 1800, 3600, 7200))
+jobs_finished = counter("postprocess_jobs_total", "Post-processing jobs finished, by result")
+
+
+class PostProcessQueue:
+    """Remux finished recordings with ffmpeg, a few at a time and at low CPU and I/O priority.
+
+    Jobs are persisted to a JSON file, so those still waiting or running when the process stops are
+    picked up again on the next start. Each process needs a file of its own, jobs are not shared between
+    processes. Recording threads only enqueue and return straight away.
+    """
+
+    def __init__(self):
+        self.path = config.DEFAULT_POSTPROCESS_QUEUE
+        self.concurrency = config.DEFAULT_POSTPROCESS_CONCURRENCY
+        self.order = config.DEFAULT_POSTPROCESS_ORDER
+        self.nice = config.DEFAULT_POSTPROCESS_NICE
+        self.ionice = config.DEFAULT_POSTPROCESS_IONICE
+        self.jobs = {}
+        # Completion callbacks are not persisted, jobs resumed after a restart have none
+        self.callbacks = {}
+        self.pending = []
+        self.running = 0
+        self.workers = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+
+    def configure(self, settings: dict):
+        self.concurrency = settings.get(config.KEY_POSTPROCESS_CONCURRENCY) or config.DEFAULT_POSTPROCESS_CONCURRENCY
+        self.order = settings.get(config.KEY_POSTPROCESS_ORDER) or config.DEFAULT_POSTPROCESS_ORDER
+        if self.order not in config.POSTPROCESS_ORDER_CHOICES:
+            raise ValueError(f"Invalid post-processing order: {self.order}")
+        self.nice = settings.get(config.KEY_POSTPROCESS_NICE, config.DEFAULT_POSTPROCESS_NICE)
+        self.ionice = settings.get(config.KEY_POSTPROCESS_IONICE, config.DEFAULT_POSTPROCESS_IONICE)
+        self.path = settings.get(config.KEY_POSTPROCESS_QUEUE) or config.DEFAULT_POSTPROCESS_QUEUE
+
+    def start(self):
+        """Resume the persisted jobs and start the workers."""
+        with self.condition:
+            if self.workers:
+                return
+            self.load()
+            for _ in range(self.concurrency):
+                worker = threading.Thread(target=self.work, name="postprocess", daemon=True)
+                worker.start()
+                self.workers.append(worker)
+
+    def submit(self, flag, input_path, output_path, on_done=None):
+        job = {
+            "id": uuid.uuid4().hex,
+            "flag": flag,
+            "input": input_path,
+            "output": output_path,
+            "created": time.time(),
+            "size": os.path.getsize(input_path),
+        }
+        # Load the persisted jobs before saving over them
+        self.start()
+        with self.condition:
+            self.jobs[job["id"]] = job
+            if on_done:
+                self.callbacks[job["id"]] = on_done
+            self.push(job)
+            self.save()
+            self.condition.notify()
+        logutil.info(flag, f"Queued ffmpeg processing ({len(self.jobs)} in queue): {os.path.basename(input_path)}")
+
+    def push(self, job):
+        key = job["created"] if self.order == "oldest" else job["size"]
+        heapq.heappush(self.pending, (key, next(self.sequence), job["id"]))
+        queue_length.set(len(self.jobs))
+
+    def work(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                job = self.jobs[heapq.heappop(self.pending)[2]]
+                self.running += 1
+                jobs_running.set(self.running)
+            try:
+                self.run(job)
+            finally:
+                with self.condition:
+                    self.running -= 1
+                    self.jobs.pop(job["id"], None)
+                    on_done = self.callbacks.pop(job["id"], None)
+                    self.save()
+                    jobs_running.set(self.running)
+                    queue_length.set(len(self.jobs))
+                if on_done:
+                    on_done()
+
+    def run(self, job):
+        flag = job["flag"]
+        logutil.info(flag, f"Starting ffmpeg processing: {os.path.basename(job['input'])}")
+        started = time.monotonic()
+        try:
+            subprocess.run(self.get_command(job), check=True, **self.get_priority_options())
+            os.remove(job["input"])
+            jobs_finished.inc(result="success")
+            logutil.info(flag, f"Finished ffmpeg processing: {os.path.basename(job['output'])}")
+        except Exception as e:
+            # Keep the recording; a failed remux is not retried
+            jobs_finished.inc(result="error")
+            logutil.error(flag, f"Error in ffmpeg processing: {os.path.basename(job['input'])}\n{e}")
+        finally:
+            job_duration.observe(time.monotonic() - started)
+
+    def get_command(self, job):
+        args = ffmpeg.input(job["input"]).output(job["output"], codec="copy", map_metadata="-1", movflags="faststart", reset_timestamps=1).global_args("-hide_banner").overwrite_output().compile()  # Add option for resetting timestamp
+        # Both are applied by wrapper commands, preexec_fn is not safe in a threaded process
+        if self.nice and os.name == "posix" and shutil.which("nice"):
+            args = ["nice", "-n", str(self.nice), *args]
+        if self.ionice and os.name == "posix" and shutil.which("ionice"):
+            # The idle class takes no priority level
+            level = ["-n", "7"] if self.ionice == 2 else []
+            args = ["ionice", "-c", str(self.ionice), *level, *args]
+        return args
+
+    def get_priority_options(self):
+        if os.name == "nt":
+            return {"creationflags": subprocess.BELOW_NORMAL_PRIORITY_CLASS}
+        return {}
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                jobs = json.load(file)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logutil.error(f"Failed to load the post-processing queue: {e}")
+            return
+        for job in jobs:
+            if job["id"] in self.jobs:
+                continue
+            if not os.path.isfile(job["input"]):
+                logutil.warning(job["flag"], f"Dropping post-processing job, the recording is gone: {job['input']}")
+                continue
+            self.jobs[job["id"]] = job
+            self.push(job)
+        if self.jobs:
+            logutil.info(f"Resumed {len(self.jobs)} post-processing jobs.")
+
+    def save(self):
+        try:
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as file:
+                json.dump(list(self.jobs.values()), file, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except Exception as e:
+            logutil.error(f"Failed to save the post-processing queue: {e}")
+
+
+postprocess_queue = PostProcessQueue()
@@ -1,34 +1,81 @@
 import asyncio
-import json
 import os
 import re
 import time
 from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
 from http.cookies import SimpleCookie
 from pathlib import Path
 from typing import Dict, Tuple
 
-import ffmpeg
 import httpx
-import streamlink
 from anyio import EndOfStream
-from bs4 import BeautifulSoup
 from httpx import HTTPError, ProtocolError
 from httpx_socks import AsyncProxyTransport
 from requests.exceptions import ConnectionError, SSLError
-from streamlink.stream import StreamIO
+from streamlink import NoPluginError, PluginError
+from streamlink.stream import HLSStream
 from streamlink_cli.main import open_stream
-from streamlink_cli.output import FileOutput
 from streamlink_cli.streamrunner import StreamRunner
 
 import utils.config as config
+from recorders.hls import HLSStreamRecorder, SegmentHistory
+from recorders.journal import RecordingJournal
+from recorders.output import TS_PACKET_SIZE, BufferedFileOutput, FFmpegOutput, SegmentedFileOutput
+from recorders.postprocess import postprocess_queue
+from recorders.recording_pool import recording_pool
+from recorders.registry import RecordingState, recordings
+from recorders.storage import storage
+from utils.backoff import BreakerState, CircuitBreaker
+from utils.cache import TTLCache
+from utils.clients import clients
+from utils.executor import create_writer, run_blocking, run_in
+from utils.metrics import gauge, histogram
+from utils.rehydration import RoomIdExtractor
+from utils.scheduler import AdaptiveScheduler, parse_started_at
+from utils.sessions import session_pool
 from utils.utils import logutil
 
-recording: Dict[str, Tuple[StreamIO, FileOutput]] = {}
+stream_latency = histogram("stream_resolve_latency_seconds", "Time from detecting a broadcast to obtaining its stream URL")
+first_byte_latency = histogram("first_byte_latency_seconds", "Time from detecting a broadcast to its first bytes on disk")
+poll_latency = histogram("recorder_request_seconds", "Latency of platform API requests", buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+active_recordings = gauge("recordings_active", "Recordings in progress")
+recording_states = gauge("recordings_by_state", "Recordings in each state, from detection to post-processing")
+recording_throughput = gauge("recording_bytes_per_second", "Bytes per second written by each recording since the last scrape")
+throughput_samples: Dict[str, Tuple[int, float]] = {}
+room_ids = TTLCache("tiktok_room_id", config.DEFAULT_TIKTOK_ROOM_ID_TTL)
+# Last room seen ended for each channel, its profile keeps pointing at it until the next broadcast
+ended_rooms = TTLCache("tiktok_ended_room", config.DEFAULT_TIKTOK_ROOM_ID_TTL)
+
+
+def publish_recording_state(recording, previous, state):
+    # State counts follow the registry's change events instead of being recounted on every scrape
+    for changed in {previous, state} - {None}:
+        recording_states.set(recordings.count(changed), state=changed.name.lower())
+    active_recordings.set(recordings.count(RecordingState.RECORDING))
+
+
+recordings.subscribe(publish_recording_state)
+
+
+def collect_recording_metrics():
+    """Update the throughput of each recording in progress."""
+    now = time.monotonic()
+    samples = {}
+    for output in [recording.output for recording in recordings.in_state(RecordingState.RECORDING)]:
+        last_written, last_time = throughput_samples.get(output.channel, (output.bytes_written, now))
+        if now > last_time:
+            recording_throughput.set((output.bytes_written - last_written) / (now - last_time), channel=output.channel)
+        samples[output.channel] = (output.bytes_written, now)
+    # Drop the series of recordings that have finished
+    for channel in throughput_samples.keys() - samples.keys():
+        recording_throughput.remove(channel=channel)
+    throughput_samples.clear()
+    throughput_samples.update(samples)
 
 
 class LiveRecorder(ABC):
-    def __init__(self, user: dict):
+    def __init__(self, user: dict, starts=None):
         # Parse required arguments
         self.platform = user.get(config.KEY_PLATFORM)
         self.id = user.get(config.KEY_ID)
@@ -42,32 +89,88 @@ class LiveRecorder(ABC):
         self.format = user.get(config.KEY_FORMAT, config.DEFAULT_FORMAT)
         self.proxy = user.get(config.KEY_PROXY)
         self.output = user.get(config.KEY_OUTPUT, config.DEFAULT_OUTPUT)
-
-        # Initialize cookies and client
+        self.secondary_output = user.get(config.KEY_SECONDARY_OUTPUT)
+        self.current_output = self.output
+        self.admission_wait = 0
+        self.priority = user.get(config.KEY_PRIORITY, config.DEFAULT_PRIORITY)
+        self.hls_engine = user.get(config.KEY_HLS_ENGINE, config.DEFAULT_HLS_ENGINE)
+        self.hls_edges = user.get(config.KEY_HLS_EDGES, [])
+        self.hedge = user.get(config.KEY_HEDGE, config.DEFAULT_HEDGE)
+        self.write_buffer = user.get(config.KEY_WRITE_BUFFER, config.DEFAULT_WRITE_BUFFER)
+        self.fsync = user.get(config.KEY_FSYNC, config.DEFAULT_FSYNC)
+        self.fsync_every = user.get(config.KEY_FSYNC_EVERY, config.DEFAULT_FSYNC_EVERY)
+        self.preallocate = user.get(config.KEY_PREALLOCATE, config.DEFAULT_PREALLOCATE)
+        self.segment_time = user.get(config.KEY_SEGMENT_TIME, config.DEFAULT_SEGMENT_TIME)
+        self.segment_size = user.get(config.KEY_SEGMENT_SIZE, config.DEFAULT_SEGMENT_SIZE)
+        self.live_remux = user.get(config.KEY_LIVE_REMUX, config.DEFAULT_LIVE_REMUX)
+        self.pipe_buffer = user.get(config.KEY_PIPE_BUFFER, config.DEFAULT_PIPE_BUFFER)
+
+        # Initialize cookies and the shared client key
         self.get_cookies()
-        self.client = self.get_client()
+        self.client_key = clients.make_key(self.proxy, self.headers, self.cookies)
+        self.scheduler = AdaptiveScheduler(self.platform, self.id, user, starts)
+        self.breaker = CircuitBreaker(self.flag, self.scheduler.channel, self.interval)
+        self.journal = RecordingJournal(self.platform, self.id, self.scheduler.channel)
+        self.segment_history = None
+        self.open_error = None
+        self.final_title = None
 
     async def start(self):
-        if not os.path.exists(self.output):
-            os.makedirs(self.output)
-
-        self.print_info()
-
+        await self.prepare()
         while True:
             try:
-                await self.run()
-                await asyncio.sleep(self.interval)
-            except ConnectionError as e:
-                logutil.error(self.flag, e)
-                await self.client.aclose()
-                self.client = self.get_client()
-                await asyncio.sleep(self.interval)
+                await asyncio.sleep(await self.poll())
             except KeyboardInterrupt:
                 logutil.warning(self.flag, "Stopped by keyboard interrupt.")
                 break
-            except Exception as e:
-                logutil.error(self.flag, f"Error in live stream detection: {e}")
-                await asyncio.sleep(self.interval)
+
+    async def prepare(self):
+        if not os.path.exists(self.output):
+            os.makedirs(self.output)
+
+        self.print_info()
+        # Subclasses may rename the channel before starting
+        self.breaker.flag = self.flag
+
+    async def poll(self) -> float:
+        """Check the channel once, recording it if it is live, and return the seconds until the next check."""
+        try:
+            self.breaker.before_attempt()
+            await self.run()
+            # Failing to open a stream counts as a failure of this poll
+            if error := self.open_error:
+                self.open_error = None
+                raise error
+            self.breaker.record_success()
+            return self.scheduler.next_interval()
+        except KeyboardInterrupt:
+            raise
+        except Exception as e:
+            return self.handle_error(e)
+
+    def is_idle(self) -> bool:
+        """Whether the channel is offline with nothing worth keeping in memory until its next poll."""
+        return not self.scheduler.live and not self.breaker.failures and not self.journal.entry
+
+    def release(self):
+        pass
+
+    def handle_error(self, e) -> float:
+        # Only log while the breaker is closed; it reports trips and re-probes itself
+        quiet = self.breaker.state(e) != BreakerState.CLOSED
+        if quiet:
+            pass
+        elif isinstance(e, ConnectionError):
+            logutil.error(self.flag, e)
+        elif isinstance(e, NoPluginError):
+            logutil.error(self.flag, f"NoPluginError: {e}")
+        elif isinstance(e, PluginError):
+            logutil.error(self.flag, f"Streamlink plugin error: {e}")
+        elif isinstance(e, PermissionError):
+            logutil.error(self.flag, f"Permission error: {e}")
+        else:
+            logutil.error(self.flag, f"Error in live stream detection: {e}")
+        return self.breaker.record_failure(e)
 
     @abstractmethod
     async def run(self):
@@ -75,7 +178,12 @@ class LiveRecorder(ABC):
 
     async def request(self, method, url, **kwargs):
         try:
-            response = await self.client.request(method, url, **kwargs)
+            self.scheduler.add_request()
+            kwargs.setdefault("timeout", self.interval)
+            kwargs.setdefault("priority", self.priority)
+            started = time.monotonic()
+            response = await clients.request(self.client_key, method, url, **kwargs)
+            poll_latency.observe(time.monotonic() - started, platform=self.platform)
             if response.status_code != 200:
                 logutil.error(f"Failed to load the page. Status code: {response.status_code}")
                 return None
@@ -87,13 +195,29 @@ class LiveRecorder(ABC):
             logutil.error(self.flag, f"Connection error: {e}")
             raise ConnectionError
         except Exception as e:
-            logutil.error(self.flag, f"Unexpected error: {e}")
+            if self.breaker.state(e) == BreakerState.CLOSED:
+                logutil.error(self.flag, f"Unexpected error: {e}")
             raise e
 
+    @asynccontextmanager
+    async def stream(self, method, url, **kwargs):
+        try:
+            self.scheduler.add_request()
+            kwargs.setdefault("timeout", self.interval)
+            kwargs.setdefault("priority", self.priority)
+            async with clients.stream(self.client_key, method, url, **kwargs) as response:
+                yield response
+        except (ConnectionError, ProtocolError, HTTPError, EndOfStream, SSLError) as e:
+            logutil.error(self.flag, f"Connection error: {e}")
+            raise ConnectionError
+
     def is_file(self, file_path):
         return os.path.isfile(file_path)
 
     def get_cookies(self):
+        # Recorders recreated by the channel store get the cookies already parsed
+        if not self.cookies or isinstance(self.cookies, dict):
+            return
         logutil.info(self.flag, "self.cookies: ", self.cookies)
         if self.cookies:
             cookies = SimpleCookie()
@@ -119,37 +243,20 @@ class LiveRecorder(ABC):
         return httpx.AsyncClient(http2=http2, timeout=timeout, limits=limits, headers=headers, cookies=cookies, proxies=proxies, transport=transport)
 
     def get_client(self):
-        client_kwargs = {
-            "http2": True,
-            "timeout": self.interval,
-            "limits": httpx.Limits(max_keepalive_connections=100, keepalive_expiry=self.interval * 2),
-            "headers": self.headers,
-            "cookies": self.cookies,
-        }
-        # Check if a proxy is set
-        if self.proxy:
-            if "socks" in self.proxy:
-                client_kwargs["transport"] = AsyncProxyTransport.from_url(self.proxy)
-            else:
-                client_kwargs["proxies"] = self.proxy
-        return httpx.AsyncClient(**client_kwargs)
+        return clients.get(self.client_key)
 
     def get_streamlink(self):
-        session = streamlink.session.Streamlink({"stream-segment-timeout": 60, "hls-segment-queue-threshold": 10})
-        # Add streamlink's HTTP related options
-        if proxy := self.proxy:
-            # If the proxy is socks5, change the streamlink proxy parameter to socks5h to prevent some streams from failing to load
-            if "socks" in proxy:
-                proxy = proxy.replace("://", "h://")
-            session.set_option("http-proxy", proxy)
-        if self.headers:
-            session.set_option("http-headers", self.headers)
-        if self.cookies:
-            session.set_option("http-cookies", self.cookies)
-        return session
+        return session_pool.get(self.proxy, self.headers, self.cookies)
 
-    def get_filename(self, title, format):
-        live_time = time.strftime("%Y.%m.%d %H.%M.%S")
+    async def get_stream(self, url):
+        # Plugin resolution does blocking network round-trips
+        streams = await run_blocking(session_pool.streams, self.get_streamlink(), url)
+        if self.scheduler.detected_at:
+            stream_latency.observe(time.monotonic() - self.scheduler.detected_at, platform=self.platform)
+        return streams.get("best")
+
+    def get_filename(self, title, format, live_time=None, part=None):
+        live_time = live_time or time.strftime("%Y.%m.%d %H.%M.%S")
         # Convert special characters in the filename to full-width characters
         char_dict = {
             '"': "＂",
@@ -165,38 +272,204 @@ class LiveRecorder(ABC):
         try:
             for half, full in char_dict.items():
                 title = title.replace(half, full)
-            filename = f"[{live_time}]{self.flag}{title[:50]}.{format}"
+            part = f"_{part:03d}" if part else ""
+            filename = f"[{live_time}]{self.flag}{title[:50]}{part}.{format}"
             return filename
         except Exception as e:
             logutil.error(self.flag, f"Exception occurred: {e}")
             return ""
 
-    def run_record(self, stream, url, title, format):
-        # Get the output filename
-        filename = self.get_filename(title, format)
-        if stream:
-            logutil.info(self.flag, f"Started recording: {filename}")
-            # Call streamlink to record the live stream
-            result = self.stream_writer(stream, url, filename)
-            # If recording is successful and format is specified and not equal to the default platform format, run ffmpeg
-            if result and self.format and self.format != format:
-                self.run_ffmpeg(filename, format)
-            recording.pop(url, None)
-            logutil.info(self.flag, f"Stopped recording: {filename}")
+    async def record(self, url, title, broadcast=None):
+        # Claiming the URL keeps a second detection of the same broadcast from starting another download
+        entry = recordings.claim(url, self.platform, self.scheduler.channel, broadcast)
+        if not entry:
+            logutil.info(self.flag, f"Already recording: {url}")
+            if asyncio.iscoroutine(title):
+                title.close()
+            return
+        try:
+            await self.record_claimed(entry, url, title)
+        finally:
+            # A recording handed over to its worker stays registered until the worker is done with it
+            recordings.release(entry)
+
+    async def record_claimed(self, entry, url, title):
+        # Resolve the stream while the title is still being fetched
+        self.final_title = None
+        title_task = asyncio.ensure_future(title) if asyncio.iscoroutine(title) else None
+        recordings.set_state(entry, RecordingState.RESOLVING)
+        stream = await self.get_stream(url)  # HLSStream[mpegts]
+        if title_task:
+            if title_task.done():
+                self.set_final_title(title_task)
+                title = self.final_title
+            else:
+                # Start on a provisional name and apply the title once it arrives
+                title = ""
+                title_task.add_done_callback(self.set_final_title)
+        # Live remux writes the final container straight away
+        format = self.format if self.live_remux and self.format in config.LIVE_REMUX_FORMATS else config.STREAM_FORMAT
+        if self.hls_engine == "native" and isinstance(stream, HLSStream):
+            await recording_pool.run_async(self, self.run_record_native, entry, stream, url, title, format)
         else:
-            logutil.error(self.flag, f"No available live stream: {filename}")
+            await recording_pool.run(self, self.run_record, entry, stream, url, title, format)
 
-    def stream_writer(self, stream, url, filename):
+    def set_final_title(self, task):
+        try:
+            self.final_title = task.result() or ""
+        except Exception as e:
+            logutil.error(self.flag, f"Cannot get title: {e}")
+            self.final_title = ""
+
+    def apply_final_title(self, directory, filename, live_time, title, format, part=None):
+        if self.final_title is None or self.final_title == title:
+            return filename
+        new_filename = self.get_filename(self.final_title, format, live_time, part)
+        try:
+            os.replace(os.path.join(directory, filename), os.path.join(directory, new_filename))
+            return new_filename
+        except OSError as e:
+            logutil.error(self.flag, f"Cannot rename {filename}: {e}")
+            return filename
+
+    def refresh_stream(self, stream, url):
+        """Return the stream to record, resolved again if the recording had to wait for admission."""
+        if not stream or not self.admission_wait:
+            return stream
+        logutil.info(self.flag, f"Resolving the stream again after waiting {self.admission_wait:.0f} seconds for admission.")
+        return session_pool.streams(self.get_streamlink(), url).get("best")
+
+    def run_record(self, entry, stream, url, title, format):
+        # The detection may have been cancelled while the recording waited for a thread
+        if not recordings.hand_over(entry):
+            return
+        try:
+            stream = self.refresh_stream(stream, url)
+            if stream:
+                output, live_time, title, _ = self.prepare_output(entry, title, format)
+                filename = output.filename.name
+                logutil.info(self.flag, f"Started recording: {filename}")
+                # Call streamlink to record the live stream
+                result = self.stream_writer(stream, entry, output)
+                self.finish_record(entry, output, live_time, title, format, result)
+            else:
+                live_time = time.strftime("%Y.%m.%d %H.%M.%S")
+                logutil.error(self.flag, f"No available live stream: {self.get_filename(title, format, live_time)}")
+        finally:
+            recordings.release(entry, worker=True)
+
+    async def run_record_native(self, entry, stream, url, title, format):
+        if not recordings.hand_over(entry):
+            return
+        # Output I/O gets its own thread instead of sharing the blocking pool with plugin resolution
+        writer = create_writer()
+        try:
+            stream = await run_blocking(self.refresh_stream, stream, url)
+            if not isinstance(stream, HLSStream):
+                logutil.error(self.flag, f"No available live stream: {self.get_filename(title, format, time.strftime('%Y.%m.%d %H.%M.%S'))}")
+                return
+            output, live_time, title, resume = await run_in(writer, self.prepare_output, entry, title, format)
+            logutil.info(self.flag, f"Started recording: {output.filename.name}")
+            result = await self.hls_writer(stream, entry, url, output, writer, resume["sequence"] if resume else None)
+            await run_in(writer, self.finish_record, entry, output, live_time, title, format, result)
+        finally:
+            writer.shutdown(wait=False)
+            recordings.release(entry, worker=True)
+
+    def prepare_output(self, entry, title, format):
+        """Return the output, start time, title and journal entry of a new recording.
+
+        If the journal shows this broadcast was being recorded when the process died, the partial file is reused.
+        """
+        resume = self.journal.resume(entry.url, entry.broadcast) if format == config.STREAM_FORMAT else None
+        if resume:
+            live_time, title = resume["live_time"], resume["title"]
+            self.current_output = os.path.dirname(resume["filename"])
+        else:
+            live_time = time.strftime("%Y.%m.%d %H.%M.%S")
+        output = self.get_output(live_time, title, format, resume)
+        # Measured when the first bytes leave the write buffer, which can be seconds after the stream opened
+        if detected_at := self.scheduler.detected_at:
+            output.on_first_write = lambda: first_byte_latency.observe(time.monotonic() - detected_at, platform=self.platform)
+        if isinstance(output, BufferedFileOutput):
+            if resume:
+                self.journal.entry = resume
+            else:
+                self.journal.begin(entry.url, entry.broadcast, output.filename, live_time, title, format, output.part)
+            output.checkpoint = lambda filename, sequence, offset: self.journal.checkpoint(filename, output.part, sequence, offset)
+        storage.add(output)
+        return output, live_time, title, resume
+
+    def finish_record(self, entry, output, live_time, title, format, result):
+        recordings.set_state(entry, RecordingState.FINALIZING)
+        self.journal.finish()
+        storage.remove(output)
+        filename = self.post_process(output.filename.parent, output.filename.name, live_time, title, format, output.part, result, entry)
+        logutil.info(self.flag, f"Stopped recording: {filename}")
+
+    def finish_part(self, path, live_time, title, format, part):
+        # Parts closed mid-broadcast are queued for processing while the recording goes on
+        filename = path.name
+        try:
+            filename = self.post_process(path.parent, filename, live_time, title, format, part)
+            logutil.info(self.flag, f"Finished part {part}: {filename}")
+        except Exception as e:
+            logutil.error(self.flag, f"Error processing part {part}: {filename}\n{e}")
+
+    def post_process(self, directory, filename, live_time, title, format, part=None, result=True, entry=None):
+        # Windows cannot rename an open file, so the final title is applied once it is closed
+        if os.path.isfile(os.path.join(directory, filename)):
+            filename = self.apply_final_title(directory, filename, live_time, title, format, part)
+        # If recording is successful and format is specified and not equal to the default platform format, run ffmpeg
+        if result and self.format and self.format != format:
+            self.run_ffmpeg(directory, filename, format, entry)
+        return filename
+
+    def get_output(self, live_time, title, format, resume=None):
+        options = dict(
+            buffer_size=self.write_buffer,
+            fsync=self.fsync,
+            fsync_every=self.fsync_every,
+            preallocate=self.preallocate,
+            resume_offset=resume["offset"] if resume else None,
+        )
+        if self.live_remux and format in config.LIVE_REMUX_FORMATS:
+            return FFmpegOutput(Path(self.current_output, self.get_filename(title, format, live_time)), self.scheduler.channel, format, self.pipe_buffer)
+        if not self.segment_time and not self.segment_size:
+            return BufferedFileOutput(Path(self.current_output, self.get_filename(title, format, live_time)), self.scheduler.channel, **options)
+        return SegmentedFileOutput(
+            lambda part, rollover=False: self.get_part_path(live_time, title, format, part, rollover),
+            self.scheduler.channel,
+            segment_time=self.segment_time,
+            segment_size=self.segment_size,
+            # Without segment boundaries only MPEG-TS can be cut safely
+            packet_size=TS_PACKET_SIZE if format == "ts" else None,
+            on_part_closed=lambda path, part: self.finish_part(path, live_time, title, format, part),
+            part=(resume["part"] or 1) if resume else 1,
+            **options,
+        )
+
+    def get_part_path(self, live_time, title, format, part, rollover=False):
+        if rollover:
+            # A new part moves to the secondary output before the primary fills up, and back once there is room
+            self.current_output = storage.choose(self.output, self.secondary_output, extra=0)
+        return Path(self.current_output, self.get_filename(title, format, live_time, part))
+
+    def stream_writer(self, stream, entry, output):
+        filename = output.filename.name
         logutil.info(self.flag, f"Obtained live stream link: {filename}\n{stream.url}")
-        output = FileOutput(Path(os.path.join(self.output, filename)))
+        opened = False
         try:
             stream_fd, prebuffer = open_stream(stream)
             output.open()
-            recording[url] = (stream_fd, output)
+            recordings.set_state(entry, RecordingState.RECORDING, stream=stream_fd, output=output)
+            opened = True
             logutil.info(self.flag, f"Recording in progress: {filename}")
             StreamRunner(stream_fd, output, show_progress=True).run(prebuffer)
             return True
         except Exception as e:
+            if not opened:
+                self.open_error = e
             if "timeout" in str(e):
                 logutil.warning(self.flag, f"Live stream recording timeout. Please check if the streamer is live or if the network connection is stable: {filename}\n{e}")
             elif re.search("(Unable to open URL|No data returned from stream)", str(e)):
@@ -206,25 +479,65 @@ class LiveRecorder(ABC):
         finally:
             output.close()
 
-    def run_ffmpeg(self, filename, format):
-        logutil.info(self.flag, f"Starting ffmpeg processing: {filename}")
+    async def hls_writer(self, stream, entry, url, output, writer, resume_sequence=None):
+        filename = output.filename.name
+        logutil.info(self.flag, f"Obtained live stream link: {filename}\n{stream.url}")
+        # A reconnect to the same broadcast only fetches the segments that were not written yet
+        if not (self.segment_history and self.segment_history.is_recent(url)):
+            self.segment_history = SegmentHistory(url)
+        if resume_sequence is not None:
+            self.segment_history.last_sequence = max(self.segment_history.last_sequence, resume_sequence)
+        engine = HLSStreamRecorder(stream.url, self.client_key, self.flag, self.scheduler.channel, history=self.segment_history, edges=self.hls_edges, hedge=self.hedge)
+        written = False
+
+        async def write(data, segment):
+            nonlocal written
+            written = True
+            await run_in(writer, output.write_segment, data, segment.sequence)
+
+        try:
+            await run_in(writer, output.open)
+            # Only the engine is closed on shutdown, the output is closed below on the writer thread
+            recordings.set_state(entry, RecordingState.RECORDING, stream=engine, output=output, native=True)
+            logutil.info(self.flag, f"Recording in progress: {filename}")
+            await engine.run(write)
+            return True
+        except Exception as e:
+            if not written:
+                self.open_error = e
+            if "timeout" in str(e):
+                logutil.warning(self.flag, f"Live stream recording timeout. Please check if the streamer is live or if the network connection is stable: {filename}\n{e}")
+            elif "Unable to open URL" in str(e):
+                logutil.warning(self.flag, f"Error opening live stream. Please check if the streamer is live: {filename}\n{e}")
+            else:
+                logutil.error(self.flag, f"Error recording live stream: {filename}\n{e}")
+        finally:
+            await run_in(writer, output.close)
+
+    def run_ffmpeg(self, directory, filename, format, entry=None):
+        # The remux runs on the post-processing queue, so the recording thread is released at once
         new_filename = filename.replace(f".{format}", f".{self.format}")
-        input_path = os.path.join(self.output, filename)
-        output_path = os.path.join(self.output, new_filename)
-        ffmpeg.input(input_path).output(output_path, codec="copy", map_metadata="-1", movflags="faststart", reset_timestamps=1).global_args("-hide_banner").run()  # Add option for resetting timestamp
-        os.remove(input_path)
+        on_done = (lambda: recordings.finish(entry)) if entry else None
+        postprocess_queue.submit(self.flag, os.path.join(directory, filename), os.path.join(directory, new_filename), on_done)
+        if entry:
+            recordings.set_state(entry, RecordingState.POST_PROCESSING)
 
     def print_info(self):
         logutil.info(self.flag, "=============================")
         logutil.info(self.flag, f"platform: {self.platform}")
         logutil.info(self.flag, f"id: {self.id}")
         logutil.info(self.flag, f"name: {self.name}")
-        logutil.info(self.flag, f"interval: {self.interval}")
+        logutil.info(self.flag, f"interval: {self.interval} ({self.scheduler.min_interval}-{self.scheduler.max_interval})")
         logutil.info(self.flag, f"headers: {self.headers}")
         logutil.info(self.flag, f"cookies: {self.cookies}")
         logutil.info(self.flag, f"format: {self.format}")
         logutil.info(self.flag, f"proxy: {self.proxy}")
-        logutil.info(self.flag, f"output: {self.output}")
+        logutil.info(self.flag, f"output: {self.output}, secondary_output: {self.secondary_output}")
+        logutil.info(self.flag, f"priority: {self.priority}")
+        logutil.info(self.flag, f"hls_engine: {self.hls_engine}, hls_edges: {self.hls_edges}, hedge: {self.hedge}")
+        logutil.info(self.flag, f"write_buffer: {self.write_buffer}, fsync: {self.fsync} ({self.fsync_every}), preallocate: {self.preallocate}")
+        logutil.info(self.flag, f"segment_time: {self.segment_time}, segment_size: {self.segment_size}")
+        logutil.info(self.flag, f"live_remux: {self.live_remux}, pipe_buffer: {self.pipe_buffer}")
         logutil.info(self.flag, "=============================")
 
 
@@ -232,7 +545,7 @@ class Afreeca(LiveRecorder):
     async def run(self):
         url = f"https://play.afreecatv.com/{self.id}"
         try:
-            if url not in recording:
+            if url not in recordings:
                 response = (
                     await self.request(
                         method="POST",
@@ -243,26 +556,28 @@ class Afreeca(LiveRecorder):
                 status = response.get("CHANNEL", {}).get("RESULT")
                 if status != 0:
                     logutil.info(self.flag, "The channel is on air.")
+                    self.scheduler.observe(True)
                     title = response.get("CHANNEL", {}).get("TITLE")
-                    stream = self.get_streamlink().streams(url).get("best")  # HLSStream[mpegts]
-                    await asyncio.to_thread(self.run_record, stream, url, title, self.format)
+                    await self.record(url, title, response.get("CHANNEL", {}).get("BNO"))
                 else:
                     logutil.info(self.flag, "The channel is offline.")
+                    self.scheduler.observe(False)
         except Exception as e:
-            logutil.error(self.flag, f"Unexpected error: {e}")
+            if self.breaker.state(e) == BreakerState.CLOSED:
+                logutil.error(self.flag, f"Unexpected error: {e}")
             raise e
 
 
 class Chzzk(LiveRecorder):
-    async def start(self):
+    async def prepare(self):
         await self.get_ids()
         self.flag = f"[{self.platform}][{self.name}]"
-        await super().start()
+        await super().prepare()
 
     async def run(self):
         url = f"https://chzzk.naver.com/live/{self.id}"
         try:
-            if url not in recording:
+            if url not in recordings:
                 response = (
                     await self.request(
                         method="GET",
@@ -272,13 +587,15 @@ class Chzzk(LiveRecorder):
                 status = response.get("content", {}).get("status")
                 if status == "OPEN":
                     logutil.info(self.flag, "The channel is on air.")
+                    self.scheduler.observe(True, parse_started_at(response.get("content", {}).get("openDate")))
                     title = response.get("content", {}).get("liveTitle").rstrip()
-                    stream = self.get_streamlink().streams(url).get("best")  # HLSStream[mpegts]
-                    await asyncio.to_thread(self.run_record, stream, url, title, self.format)
+                    await self.record(url, title, response.get("content", {}).get("liveId"))
                 else:
                     logutil.info(self.flag, "The channel is offline.")
+                    self.scheduler.observe(False)
         except Exception as e:
-            logutil.error(self.flag, f"Error occurred while running the recorder: {e}")
+            if self.breaker.state(e) == BreakerState.CLOSED:
+                logutil.error(self.flag, f"Error occurred while running the recorder: {e}")
             raise e
 
     async def check_if_id(self, channel):
@@ -363,36 +680,137 @@ class Chzzk(LiveRecorder):
 
 
 class TikTok(LiveRecorder):
-    async def start(self):
+    def __init__(self, user: dict, starts=None):
+        super().__init__(user, starts)
+        # Set by the multi-channel runner to share one batched liveness check
+        self.alive_poller = None
+        self.room_id = ""
         self.flag = f"[{self.platform}][{self.id}]"
-        await super().start()
+        self.breaker.flag = self.flag
+
+    def release(self):
+        # Stop the shared poller checking a room nobody is waiting on
+        self.set_room_id("")
 
     async def run(self):
+        if self.alive_poller:
+            await self.run_batched()
+            return
+
         url = f"https://www.tiktok.com/@{self.id}/live"
         try:
-            if url not in recording:
-                room_id = await self.get_room_id()
-                response = (
-                    await self.request(
-                        method="GET",
-                        url=f"https://www.tiktok.com/api/live/detail/?aid=1988&roomID={room_id}",
-                    )
-                ).json()
-                status = response.get("LiveRoomInfo", {}).get("status")
-                if status and status != 4:
+            if url not in recordings:
+                room_id = await self.get_cached_room_id()
+                if not room_id or self.is_ended(room_id):
+                    logutil.info(self.flag, "The channel is offline.")
+                    self.scheduler.observe(False)
+                    return
+
+                # Status and title come from the same response
+                info = await self.get_room_info(room_id)
+                owner = info.get("owner", {}).get("display_id")
+                if not info or (owner and owner != self.id):
+                    logutil.info(self.flag, "Cached Room ID does not match the channel.")
+                    self.invalidate_room_id()
+                    return
+
+                if info.get("status") == 2:
+                    logutil.info(self.flag, "The channel is on air.")
+                    self.scheduler.observe(True, parse_started_at(info.get("create_time")))
+                    title = info.get("title") or ""
+                    await self.record(url, title, room_id)
+                    # A new broadcast gets a new room ID
+                    self.invalidate_room_id()
+                else:
+                    logutil.info(self.flag, "The channel is offline.")
+                    # The profile of an offline channel points at its last, ended room; the next broadcast gets a new one
+                    if info.get("status") == 4:
+                        self.end_room(room_id)
+                    elif self.scheduler.live:
+                        self.invalidate_room_id()
+                    else:
+                        room_ids.set(self.id, room_id, min(room_ids.remaining(self.id), config.DEFAULT_TIKTOK_OFFLINE_ROOM_ID_TTL))
+                    self.scheduler.observe(False)
+        except Exception as e:
+            if self.breaker.state(e) == BreakerState.CLOSED:
+                logutil.error(self.flag, f"Error occurred while running the recorder: {e}")
+            raise e
+
+    async def run_batched(self):
+        url = f"https://www.tiktok.com/@{self.id}/live"
+        try:
+            if url not in recordings:
+                # Liveness comes from the shared poller; the room ID is only resolved when the cache expires
+                self.set_room_id(await self.get_cached_room_id())
+                if not self.room_id or self.is_ended(self.room_id):
+                    self.set_room_id("")
+                    logutil.info(self.flag, "The channel is offline.")
+                    self.scheduler.observe(False)
+                    return
+
+                timeout = min(room_ids.remaining(self.id), config.DEFAULT_TIKTOK_OFFLINE_ROOM_ID_TTL)
+                alive = await self.alive_poller.wait_alive(self.room_id, timeout)
+                if alive:
                     logutil.info(self.flag, "The channel is on air.")
-                    title = await self.get_title(room_id)
-                    stream = self.get_streamlink().streams(url).get("best")  # HLSStream[mpegts]
-                    await asyncio.to_thread(self.run_record, stream, url, title, self.format)
+                    self.scheduler.observe(True)
+                    await self.record(url, self.get_title(self.room_id), self.room_id)
+                    # A new broadcast gets a new room ID
+                    self.invalidate_room_id()
                 else:
                     logutil.info(self.flag, "The channel is offline.")
+                    # A room reported not alive has ended, the profile is read again for the next one once the TTL
+                    # expires. Without an answer the room is waited on again until then
+                    if alive is False:
+                        self.end_room(self.room_id)
+                        self.set_room_id("")
+                    else:
+                        room_ids.set(self.id, self.room_id, min(room_ids.remaining(self.id), config.DEFAULT_TIKTOK_OFFLINE_ROOM_ID_TTL))
+                    self.scheduler.observe(False)
         except Exception as e:
-            logutil.error(self.flag, f"Error occurred while running the recorder: {e}")
+            if self.breaker.state(e) == BreakerState.CLOSED:
+                logutil.error(self.flag, f"Error occurred while running the recorder: {e}")
             raise e
 
+    def set_room_id(self, room_id):
+        if self.alive_poller and self.room_id and self.room_id != room_id:
+            self.alive_poller.unregister(self.room_id)
+        self.room_id = room_id
+
+    def invalidate_room_id(self):
+        room_ids.invalidate(self.id)
+        self.set_room_id("")
+
+    def is_ended(self, room_id) -> bool:
+        if ended_rooms.get(self.id) != room_id:
+            return False
+        ended_rooms.set(self.id, room_id)
+        return True
+
+    def end_room(self, room_id):
+        # An ended room is not checked again; the profile is read for the next broadcast's room once the short TTL expires
+        ended_rooms.set(self.id, room_id)
+        room_ids.set(self.id, room_id, config.DEFAULT_TIKTOK_OFFLINE_ROOM_ID_TTL)
+
+    async def get_cached_room_id(self) -> str:
+        room_id = room_ids.get(self.id)
+        if room_id is None:
+            room_id = await self.get_room_id()
+            # A channel without a room, or still showing its ended one, is looked up again after the short TTL
+            offline = not room_id or ended_rooms.get(self.id) == room_id
+            room_ids.set(self.id, room_id, config.DEFAULT_TIKTOK_OFFLINE_ROOM_ID_TTL if offline else None)
+        return room_id
+
+    async def get_room_info(self, room_id) -> dict:
+        url = f"https://webcast.tiktok.com/webcast/room/info/?aid=1988&room_id={room_id}"
+        response = await self.request(method="GET", url=url)
+        if not response:
+            return {}
+        return response.json().get("data") or {}
+
     async def get_room_id(self) -> str:
         room_id = await self.get_room_id_2()
-        if not room_id:
+        # The live page is only read when the profile page had no data to look in
+        if room_id is None:
             room_id = await self.get_room_id_1()
 
         if not room_id:
@@ -402,51 +820,43 @@ class TikTok(LiveRecorder):
         return room_id
 
     async def get_room_id_1(self) -> str:
+        # Connection errors propagate to the breaker instead of passing for an offline channel
         url = f"https://www.tiktok.com/@{self.id}/live"
-        try:
-            response = await self.request(method="GET", url=url)
-            match = re.search(r"room_id=(\d+)", response.text)
-            if not match:
-                logutil.info(self.flag, "Room ID not found")
-                return ""
-            room_id = match.group(1)
-            return room_id
-
-        except Exception as e:
-            logutil.error(self.flag, f"Unexpected error: {e}")
+        response = await self.request(method="GET", url=url)
+        if not response:
+            return ""
+        match = re.search(r"room_id=(\d+)", response.text)
+        if not match:
+            logutil.info(self.flag, "Room ID not found")
             return ""
+        return match.group(1)
 
-    async def get_room_id_2(self) -> str:
+    async def get_room_id_2(self):
         url = f"https://www.tiktok.com/@{self.id}"
-        try:
-            response = await self.request(method="GET", url=url)
-
-            soup = BeautifulSoup(response.text, "html.parser")
-            if not soup:
-                logutil.error(self.flag, "Failed to parse the page.")
-                return ""
-
-            script_tag = soup.find("script", id="__UNIVERSAL_DATA_FOR_REHYDRATION__")
-            if not script_tag:
-                logutil.error(self.flag, "Cannot find script tag for this ID.")
-                return ""
-
-            json_data = json.loads(script_tag.string)
-            if not json_data:
-                logutil.error(self.flag, "Failed to load JSON data.")
-                return ""
-
-            room_id = json_data.get("__DEFAULT_SCOPE__", {}).get("webapp.user-detail", {}).get("userInfo", {}).get("user", {}).get("roomId")
-            if not room_id:
-                logutil.info(self.flag, "Cannot find Room ID.")
-                return ""
-
-            return room_id
-
-        except Exception as e:
-            logutil.error(self.flag, f"Unexpected error: {e}")
+        # Stop reading the profile page as soon as the room ID has been seen
+        extractor = RoomIdExtractor()
+        async with self.stream(method="GET", url=url) as response:
+            status_code = response.status_code
+            if status_code == 200:
+                async for chunk in response.aiter_bytes():
+                    if extractor.feed(chunk):
+                        break
+
+        # A redirect or 403 means TikTok is blocking this client, which the breaker has to back off from
+        if status_code in (301, 302, 303, 307, 403):
+            raise PermissionError(f"TikTok refused the profile page. Status code: {status_code}")
+        if status_code != 200:
+            raise ConnectionError(f"Failed to load the profile page. Status code: {status_code}")
+
+        if extractor.room_id is None:
+            logutil.error(self.flag, "Cannot find script tag for this ID.")
+            return None
+        if not extractor.room_id:
+            logutil.info(self.flag, "Cannot find Room ID.")
             return ""
 
+        return extractor.room_id
+
     async def get_title(self, room_id) -> str:
         url = f"https://webcast.tiktok.com/webcast/room/info/?aid=1988&room_id={room_id}"
         try:
@@ -467,7 +877,8 @@ class TikTok(LiveRecorder):
             return title
 
         except Exception as e:
-            logutil.error(self.flag, f"Unexpected error: {e}")
+            if self.breaker.state(e) == BreakerState.CLOSED:
+                logutil.error(self.flag, f"Unexpected error: {e}")
             raise e
 
 
@@ -475,7 +886,7 @@ class Pandalive(LiveRecorder):
     async def run(self):
         url = f"https://www.pandalive.co.kr/live/play/{self.id}"
         try:
-            if url not in recording:
+            if url not in recordings:
                 response = (
                     await self.request(
                         method="POST", url="https://api.pandalive.co.kr/v1/live/play", headers={"x-device-info": '{"t":"webMobile","v":"1.0","ui":0}'}, data={"action": "watch", "userId": self.id}
@@ -484,11 +895,14 @@ class Pandalive(LiveRecorder):
                 status = response.get("result")
                 if status:
                     logutil.info(self.flag, "The channel is on air.")
+                    self.scheduler.observe(True, parse_started_at(response.get("media", {}).get("startTime")))
                     title = response.get("media", {}).get("title")
-                    stream = self.get_streamlink().streams(url).get("best")  # HLSStream[mpegts]
-                    await asyncio.to_thread(self.run_record, stream, url, title, self.format)
+                    # The start time is the only thing that tells one broadcast from the next
+                    await self.record(url, title, response.get("media", {}).get("startTime"))
                 else:
                     logutil.info(self.flag, "The channel is offline.")
+                    self.scheduler.observe(False)
         except Exception as e:
-            logutil.error(self.flag, f"Unexpected error: {e}")
+            if self.breaker.state(e) == BreakerState.CLOSED:
+                logutil.error(self.flag, f"Unexpected error: {e}")
             raise e
@@ -1,5 +1,4 @@
 import io
-import json
 import os
 import re
 import sys
@@ -8,10 +7,10 @@ from enum import Enum, IntEnum
 
 import ffmpeg
 import requests
-from bs4 import BeautifulSoup
 from requests.exceptions import ConnectionError, SSLError
 
 from recorders.recorder import LiveRecorder
+from utils.rehydration import RoomIdExtractor
 from utils.utils import logutil
 
 
@@ -334,39 +333,29 @@ class TikTok(LiveRecorder):
     def test_get_room_id_from_user(self):
         url = f"https://www.tiktok.com/@{self.id}"
         try:
-            response = requests.get(url, headers=self.headers)
-            if response.status_code != 200:
-                logutil.error(f"Failed to load the page. Status code: {response.status_code}")
-                if response.status_code == 403:
-                    logutil.info(self.flag, "Temporary error: 403 Forbidden.")
-                else:
-                    logutil.error(self.flag, f"Failed to load the page. Status code: {response.status_code}")
-                return None
-            if not response.content:
-                logutil.error(self.flag, "Response content is empty.")
-                return None
-
-            soup = BeautifulSoup(response.text, "html.parser")
-            if not soup:
-                logutil.error(self.flag, "Failed to parse the page.")
-                return None
+            # Stop reading the profile page as soon as the room ID has been seen
+            extractor = RoomIdExtractor()
+            with requests.get(url, headers=self.headers, stream=True) as response:
+                if response.status_code != 200:
+                    logutil.error(f"Failed to load the page. Status code: {response.status_code}")
+                    if response.status_code == 403:
+                        logutil.info(self.flag, "Temporary error: 403 Forbidden.")
+                    else:
+                        logutil.error(self.flag, f"Failed to load the page. Status code: {response.status_code}")
+                    return None
+                for chunk in response.iter_content(chunk_size=16384):
+                    if extractor.feed(chunk):
+                        break
 
-            script_tag = soup.find("script", id="__UNIVERSAL_DATA_FOR_REHYDRATION__")
-            if not script_tag:
+            if extractor.room_id is None:
                 logutil.error(self.flag, "Cannot find script tag for this ID.")
                 return None
 
-            json_data = json.loads(script_tag.string)
-            if not json_data:
-                logutil.error(self.flag, "Failed to load JSON data.")
-                return None
-
-            room_id = json_data.get("__DEFAULT_SCOPE__", {}).get("webapp.user-detail", {}).get("userInfo", {}).get("user", {}).get("roomId")
-            if not room_id:
+            if not extractor.room_id:
                 logutil.info(self.flag, "Cannot find Room ID.")
                 return None
 
-            return room_id
+            return extractor.room_id
 
         except SSLError as e:
             logutil.error(self.flag, f"SSL error: {e}")
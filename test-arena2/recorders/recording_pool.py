@@ -0,0 +1,164 @@
+import asyncio
+import functools
+import heapq
+import itertools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import utils.config as config
+from recorders.storage import storage
+from utils.metrics import counter, gauge
+from utils.utils import logutil
+
+pool_active = gauge("recording_pool_active", "Recordings running in the recording pool")
+pool_queued = gauge("recording_pool_queued", "Recordings waiting for admission")
+pool_rejected = counter("recording_pool_rejected_total", "Recordings refused by admission control")
+
+
+class RecordingPool:
+    """Run long-lived recordings on their own threads, admitting them only while resources allow."""
+
+    def __init__(self):
+        self.max_recordings = config.DEFAULT_MAX_RECORDINGS
+        self.bandwidth_limit = config.DEFAULT_BANDWIDTH_LIMIT
+        self.max_load = config.DEFAULT_MAX_LOAD
+        self.admission = config.DEFAULT_ADMISSION
+        self.admission_timeout = config.DEFAULT_ADMISSION_TIMEOUT
+        self.recheck_interval = config.DEFAULT_ADMISSION_RECHECK_INTERVAL
+        self.executor = None
+        self.active = 0
+        self.waiting = []
+        self.sequence = itertools.count()
+
+    def configure(self, settings: dict):
+        self.max_recordings = settings.get(config.KEY_MAX_RECORDINGS) or config.DEFAULT_MAX_RECORDINGS
+        self.bandwidth_limit = settings.get(config.KEY_BANDWIDTH_LIMIT) or config.DEFAULT_BANDWIDTH_LIMIT
+        self.max_load = settings.get(config.KEY_MAX_LOAD) or config.DEFAULT_MAX_LOAD
+        storage.configure(settings)
+        self.admission = settings.get(config.KEY_ADMISSION) or config.DEFAULT_ADMISSION
+        if self.admission not in config.ADMISSION_CHOICES:
+            raise ValueError(f"Invalid admission policy: {self.admission}")
+        self.admission_timeout = settings.get(config.KEY_ADMISSION_TIMEOUT) or config.DEFAULT_ADMISSION_TIMEOUT
+        if self.executor:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    def get_executor(self) -> ThreadPoolExecutor:
+        if not self.executor:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_recordings, thread_name_prefix="recording")
+        return self.executor
+
+    def check_admission(self, output):
+        """Return the resource and reason a new recording cannot start now, or None."""
+        if self.active >= self.max_recordings:
+            return "slots", f"{self.active} of {self.max_recordings} recording slots in use"
+
+        if self.bandwidth_limit and (self.active + 1) * config.DEFAULT_BITRATE_ESTIMATE > self.bandwidth_limit:
+            return "bandwidth", f"bandwidth limit of {self.bandwidth_limit} Mbps reached"
+
+        # Room for this recording on top of the space the active ones are projected to need
+        if reason := storage.check(output, storage.estimate() * storage.horizon):
+            return "disk", reason
+
+        # Load average counts tasks blocked on I/O as well, so it is only checked when asked for. Not available on Windows
+        if self.max_load and hasattr(os, "getloadavg"):
+            load = os.getloadavg()[0] / (os.cpu_count() or 1)
+            if load > self.max_load:
+                return "cpu", f"CPU load {load:.2f} per core"
+
+        return None
+
+    async def admit(self, recorder) -> bool:
+        recorder.current_output = storage.choose(recorder.output, recorder.secondary_output)
+        # Recordings that waited resolve their stream again, its URL may have expired in the meantime
+        recorder.admission_wait = 0
+        rejection = self.check_admission(recorder.current_output)
+        if rejection:
+            resource, reason = rejection
+            pool_rejected.inc(resource=resource)
+            if self.admission == "reject":
+                logutil.error(recorder.flag, f"Recording rejected: {reason}.")
+                return False
+            logutil.warning(recorder.flag, f"Recording queued with priority {recorder.priority}: {reason}.")
+            started = time.monotonic()
+            if not await self.wait_for_admission(recorder):
+                return False
+            recorder.admission_wait = time.monotonic() - started
+        else:
+            self.active += 1
+        pool_active.set(self.active)
+        return True
+
+    def release(self):
+        self.active -= 1
+        pool_active.set(self.active)
+        self.admit_waiting()
+
+    async def run(self, recorder, func, *args):
+        if not await self.admit(recorder):
+            return None
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.get_executor(), functools.partial(func, *args))
+        finally:
+            self.release()
+
+    async def run_async(self, recorder, func, *args):
+        # Recordings driven by the event loop need a slot but no thread
+        if not await self.admit(recorder):
+            return None
+        try:
+            return await func(*args)
+        finally:
+            self.release()
+
+    async def wait_for_admission(self, recorder) -> bool:
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiting, (recorder.priority, next(self.sequence), recorder.current_output, waiter))
+        pool_queued.set(len(self.waiting))
+        deadline = time.monotonic() + self.admission_timeout
+        try:
+            while not waiter.done():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.drop(waiter)
+                    pool_rejected.inc(resource="timeout")
+                    logutil.error(recorder.flag, f"Recording rejected: not admitted within {self.admission_timeout} seconds.")
+                    return False
+                await asyncio.wait({waiter}, timeout=min(self.recheck_interval, remaining))
+                # Disk space and CPU load can recover without another recording ending
+                self.admit_waiting()
+        except asyncio.CancelledError:
+            # Give the slot back if it was granted while we were being cancelled
+            if waiter.done() and not waiter.cancelled():
+                self.active -= 1
+                pool_active.set(self.active)
+                self.admit_waiting()
+            else:
+                self.drop(waiter)
+            raise
+        logutil.info(recorder.flag, "Recording admitted from the queue.")
+        return True
+
+    def drop(self, waiter):
+        waiter.cancel()
+        self.waiting = [item for item in self.waiting if item[3] is not waiter]
+        heapq.heapify(self.waiting)
+        pool_queued.set(len(self.waiting))
+
+    def admit_waiting(self):
+        while self.waiting:
+            priority, sequence, output, waiter = self.waiting[0]
+            if waiter.done():
+                heapq.heappop(self.waiting)
+                continue
+            if self.check_admission(output):
+                break
+            heapq.heappop(self.waiting)
+            self.active += 1
+            waiter.set_result(None)
+        pool_queued.set(len(self.waiting))
+
+
+recording_pool = RecordingPool()
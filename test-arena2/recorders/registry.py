@@ -0,0 +1,169 @@
+import threading
+import time
+from enum import IntEnum
+from typing import Dict, Set
+
+from utils.utils import logutil
+
+
+class RecordingState(IntEnum):
+    """Enumeration that defines the states of a recording"""
+
+    DETECTING = 0
+    RESOLVING = 1
+    RECORDING = 2
+    FINALIZING = 3
+    POST_PROCESSING = 4
+
+
+TRANSITIONS = {
+    RecordingState.DETECTING: {RecordingState.RESOLVING},
+    RecordingState.RESOLVING: {RecordingState.RECORDING, RecordingState.FINALIZING},
+    RecordingState.RECORDING: {RecordingState.FINALIZING},
+    RecordingState.FINALIZING: {RecordingState.POST_PROCESSING},
+    RecordingState.POST_PROCESSING: set(),
+}
+
+
+class Recording:
+    """One broadcast being recorded, from its detection until its post-processing is done."""
+
+    __slots__ = ("url", "platform", "channel", "broadcast", "state", "stream", "output", "native", "worker", "updated")
+
+    def __init__(self, url, platform, channel, broadcast=None):
+        self.url = url
+        self.platform = platform
+        self.channel = channel
+        # Platform identifier of this broadcast, the URL is the channel's and is the same for every broadcast
+        self.broadcast = broadcast
+        self.state = RecordingState.DETECTING
+        self.stream = None
+        self.output = None
+        # Native recordings close their output on their writer thread, only the engine is closed from outside
+        self.native = False
+        self.worker = False
+        self.updated = time.monotonic()
+
+
+class RecordingRegistry:
+    """Recordings of every channel, shared by the event loop and the recording threads.
+
+    A broadcast URL is claimed once, so a second detection of the same broadcast cannot start another download.
+    The URL is released when the recording moves on to post-processing, which then runs alongside any new
+    broadcast of the channel. Once handed over to the worker that records it, only that worker finishes a
+    recording, so a cancelled detection leaves it registered until its stream is closed. Listeners are called with (recording, previous state, new state) after every change,
+    the new state being None once the recording is done; they run on the thread that made the change.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.urls: Dict[str, Recording] = {}
+        self.states: Dict[RecordingState, Set[Recording]] = {state: set() for state in RecordingState}
+        self.platforms: Dict[str, Set[Recording]] = {}
+        self.listeners = []
+
+    def __contains__(self, url):
+        return url in self.urls
+
+    def __len__(self):
+        return len(self.urls)
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def publish(self, recording, previous, state):
+        for listener in self.listeners:
+            try:
+                listener(recording, previous, state)
+            except Exception as e:
+                logutil.error(f"Recording listener failed: {e}")
+
+    def get(self, url) -> Recording:
+        return self.urls.get(url)
+
+    def claim(self, url, platform, channel, broadcast=None) -> Recording:
+        """Register a detected broadcast, or return None if it is already being recorded."""
+        with self.lock:
+            if url in self.urls:
+                return None
+            recording = Recording(url, platform, channel, broadcast)
+            self.urls[url] = recording
+            self.states[recording.state].add(recording)
+            self.platforms.setdefault(platform, set()).add(recording)
+        self.publish(recording, None, recording.state)
+        return recording
+
+    def set_state(self, recording: Recording, state: RecordingState, **attributes) -> bool:
+        """Move a recording to the next state, or return False if it is already done."""
+        with self.lock:
+            previous = recording.state
+            if previous is None:
+                return False
+            if state not in TRANSITIONS[previous]:
+                raise ValueError(f"Invalid recording state change: {previous.name} -> {state.name}")
+            self.states[previous].discard(recording)
+            self.states[state].add(recording)
+            recording.state = state
+            recording.updated = time.monotonic()
+            for name, value in attributes.items():
+                setattr(recording, name, value)
+            if state == RecordingState.POST_PROCESSING and self.urls.get(recording.url) is recording:
+                del self.urls[recording.url]
+        self.publish(recording, previous, state)
+        return True
+
+    def hand_over(self, recording: Recording) -> bool:
+        """Give the recording to the worker about to record it, or return False if it is already done."""
+        with self.lock:
+            if recording.state is None:
+                return False
+            recording.worker = True
+            return True
+
+    def release(self, recording: Recording, worker=False):
+        """Finish a recording unless post-processing still holds it, or, called by the detection, a worker does."""
+        with self.lock:
+            if recording.state == RecordingState.POST_PROCESSING or (recording.worker and not worker):
+                return
+            previous = self.remove(recording)
+        if previous is not None:
+            self.publish(recording, previous, None)
+
+    def finish(self, recording: Recording):
+        with self.lock:
+            previous = self.remove(recording)
+        if previous is not None:
+            self.publish(recording, previous, None)
+
+    def remove(self, recording: Recording):
+        # Called with the lock held, returns the state the recording left
+        previous = recording.state
+        if previous is None:
+            return None
+        self.states[previous].discard(recording)
+        self.platforms[recording.platform].discard(recording)
+        if self.urls.get(recording.url) is recording:
+            del self.urls[recording.url]
+        recording.state = None
+        return previous
+
+    def in_state(self, state: RecordingState) -> list:
+        with self.lock:
+            return list(self.states[state])
+
+    def on_platform(self, platform) -> list:
+        with self.lock:
+            return list(self.platforms.get(platform, ()))
+
+    def count(self, state: RecordingState) -> int:
+        return len(self.states[state])
+
+    def close_all(self):
+        """Close the stream and output of every recording in progress."""
+        for recording in self.in_state(RecordingState.RECORDING):
+            recording.stream.close()
+            if not recording.native:
+                recording.output.close()
+
+
+recordings = RecordingRegistry()
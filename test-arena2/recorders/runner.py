@@ -0,0 +1,108 @@
+import asyncio
+import tracemalloc
+
+import utils.config as config
+from recorders.channels import ChannelStore
+from recorders.postprocess import postprocess_queue
+from recorders.recorder import Afreeca, Chzzk, Pandalive, TikTok, collect_recording_metrics
+from recorders.registry import RecordingState, recordings
+from recorders.recording_pool import recording_pool
+from recorders.storage import storage
+from recorders.tiktok_alive import TikTokAlivePoller
+from utils.clients import clients
+from utils.executor import LoopLagMonitor
+from utils.json_processor import JSONProcessor
+from utils.metrics_server import MetricsServer
+from utils.utils import logutil
+
+PLATFORMS = {
+    "Afreeca": Afreeca,
+    "Chzzk": Chzzk,
+    "TikTok": TikTok,
+    "Pandalive": Pandalive,
+}
+
+
+class MultiRecorder:
+    """Poll every configured channel from a single event loop, keeping idle channels in a compact store."""
+
+    def __init__(self, users: list, memory_report_interval=config.DEFAULT_MEMORY_REPORT_INTERVAL, metrics_port=config.DEFAULT_METRICS_PORT):
+        # Drop unset options so each recorder falls back to its own defaults
+        self.users = [{key: value for key, value in user.items() if value is not None} for user in users]
+        self.memory_report_interval = memory_report_interval
+        self.metrics_port = metrics_port
+        self.channels = ChannelStore(on_create=self.attach_alive_poller)
+        self.memory = 0
+        self.alive_pollers = {}
+        self.tasks = []
+        self.lag_monitor = LoopLagMonitor()
+
+    @classmethod
+    def from_file(cls, file_path, **kwargs):
+        processor = JSONProcessor(file_path)
+        users = processor.process()
+        # Process-wide settings live next to the channel options
+        recording_pool.configure({key: processor.data.get(key) for key in config.POOL_KEYS})
+        postprocess_queue.configure({key: processor.data[key] for key in config.POSTPROCESS_KEYS if key in processor.data})
+        return cls(users, **kwargs)
+
+    def create_channels(self):
+        before = self.get_traced_memory()
+        for user in self.users:
+            platform = PLATFORMS.get(user.get(config.KEY_PLATFORM))
+            if not platform:
+                logutil.error(f"Unsupported platform: {user.get(config.KEY_PLATFORM)} ({user.get(config.KEY_ID)})")
+                continue
+            self.channels.add(platform, user)
+        self.memory = self.get_traced_memory() - before
+        logutil.info(f"Created {len(self.channels)} channels with {len(self.channels.profiles)} profiles from {len(self.users)} users.")
+
+    def attach_alive_poller(self, recorder):
+        # TikTok channels sharing a proxy share one batched liveness poller, started with its first channel
+        if not isinstance(recorder, TikTok):
+            return
+        if recorder.proxy not in self.alive_pollers:
+            poller = TikTokAlivePoller(recorder.client_key, recorder.interval)
+            self.alive_pollers[recorder.proxy] = poller
+            self.tasks.append(asyncio.create_task(poller.start()))
+        recorder.alive_poller = self.alive_pollers[recorder.proxy]
+
+    def get_traced_memory(self):
+        if not tracemalloc.is_tracing():
+            return 0
+        return tracemalloc.get_traced_memory()[0]
+
+    async def report_memory(self):
+        while True:
+            await asyncio.sleep(self.memory_report_interval)
+            total = self.get_traced_memory()
+            count = len(self.channels) or 1
+            loaded = self.channels.loaded()
+            logutil.info("=============================")
+            logutil.info(f"channels: {len(self.channels)}, loaded: {len(loaded)}, recording: {recordings.count(RecordingState.RECORDING)}, queued: {len(recording_pool.waiting)}, post-processing: {len(postprocess_queue.jobs)}, max loop lag: {self.lag_monitor.max_lag:.3f} s")
+            logutil.info(f"traced memory: {total / 1024:.1f} KiB total, {self.memory / count:.0f} B per idle channel, requests: {self.channels.total_requests()}")
+            for state in loaded:
+                logutil.info(state.recorder.flag, f"requests: {state.recorder.scheduler.requests}")
+            clients.report()
+            logutil.info("=============================")
+
+    async def run(self):
+        if self.memory_report_interval:
+            tracemalloc.start()
+        self.create_channels()
+        postprocess_queue.start()
+
+        tasks = self.tasks
+        tasks.append(asyncio.create_task(self.channels.start()))
+        tasks.append(asyncio.create_task(self.lag_monitor.start()))
+        if self.memory_report_interval:
+            tasks.append(asyncio.create_task(self.report_memory()))
+        if self.metrics_port:
+            tasks.append(asyncio.create_task(MetricsServer(self.metrics_port, collectors=[collect_recording_metrics, storage.update_metrics]).start()))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            await clients.aclose()
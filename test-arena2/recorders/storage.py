@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+
+import utils.config as config
+from utils.disk import get_drive_free_space, get_file_allocated_size
+from utils.metrics import gauge
+from utils.utils import logutil
+
+GIB = 1024**3
+
+disk_free = gauge("disk_free_bytes", "Free space of each output directory's volume")
+disk_projected = gauge("disk_projected_need_bytes", "Space the active recordings on each output directory's volume are projected to need")
+disk_exhaustion = gauge("disk_exhaustion_seconds", "Time until each output directory's volume reaches the free space minimum at the current write rate")
+
+
+class StorageMonitor:
+    """Project the disk space active recordings will need and pick the directory new recordings and parts go to.
+
+    Each recording's bitrate is measured once it has run for a few seconds, until then the configured estimate is used.
+    A recording is sent to the secondary output directory when the primary volume would fall below the free
+    space minimum within the projection horizon. Both are off unless configured.
+    """
+
+    def __init__(self):
+        self.min_free_space = config.DEFAULT_MIN_FREE_SPACE
+        self.horizon = config.DEFAULT_SPACE_HORIZON
+        self.outputs = {}
+        self.directories = set()
+        self.lock = threading.Lock()
+
+    def configure(self, settings: dict):
+        self.min_free_space = settings.get(config.KEY_MIN_FREE_SPACE) or config.DEFAULT_MIN_FREE_SPACE
+        self.horizon = settings.get(config.KEY_SPACE_HORIZON) or config.DEFAULT_SPACE_HORIZON
+
+    def add(self, output):
+        with self.lock:
+            self.outputs[output] = time.monotonic()
+
+    def remove(self, output):
+        with self.lock:
+            self.outputs.pop(output, None)
+
+    def bitrate(self, output, started) -> float:
+        """Bytes per second written by the output, or the configured estimate while it is too early to tell."""
+        elapsed = time.monotonic() - started
+        if elapsed < config.DEFAULT_BITRATE_SAMPLE_TIME or not output.bytes_written:
+            return config.DEFAULT_BITRATE_ESTIMATE * 1e6 / 8
+        return output.bytes_written / elapsed
+
+    def estimate(self) -> float:
+        """Bitrate expected of a new recording: the average of the measured ones."""
+        with self.lock:
+            outputs = list(self.outputs.items())
+        if not outputs:
+            return config.DEFAULT_BITRATE_ESTIMATE * 1e6 / 8
+        return sum(self.bitrate(output, started) for output, started in outputs) / len(outputs)
+
+    def reserved(self, output) -> int:
+        # Space preallocated past the write position is already taken from the free space
+        try:
+            return max(get_file_allocated_size(output.filename) - output.position, 0)
+        except (OSError, AttributeError):
+            return 0
+
+    def usage(self, directory):
+        """Return the free space, projected need and write rate of the volume holding directory."""
+        volume = os.stat(directory).st_dev
+        need = 0
+        rate = 0
+        with self.lock:
+            outputs = list(self.outputs.items())
+        for output, started in outputs:
+            try:
+                if os.stat(output.filename.parent).st_dev != volume:
+                    continue
+            except OSError:
+                continue
+            bitrate = self.bitrate(output, started)
+            rate += bitrate
+            need += max(bitrate * self.horizon - self.reserved(output), 0)
+        return get_drive_free_space(directory), need, rate
+
+    def check(self, directory, extra=0):
+        """Return None if the volume holding directory has room for its recordings plus extra bytes, else the reason."""
+        if not self.min_free_space and not self.horizon:
+            return None
+        free, need, _ = self.usage(directory)
+        if free - need - extra >= self.min_free_space * GIB:
+            return None
+        return f"only {free / GIB:.1f} GiB free in {directory}, {need / GIB:.1f} GiB projected for the next {self.horizon / 60:.0f} minutes of active recordings"
+
+    def choose(self, primary, secondary=None, extra=None) -> str:
+        """Return the directory a new recording or part should be written to."""
+        self.directories.add(primary)
+        extra = self.estimate() * self.horizon if extra is None else extra
+        if not secondary or not self.check(primary, extra):
+            return primary
+        os.makedirs(secondary, exist_ok=True)
+        self.directories.add(secondary)
+        if self.check(secondary, extra):
+            return primary
+        logutil.warning(f"Switching recordings to the secondary output {secondary}: {self.check(primary, extra)}")
+        return secondary
+
+    def update_metrics(self):
+        with self.lock:
+            directories = self.directories | {str(output.filename.parent) for output in self.outputs}
+        for directory in directories:
+            try:
+                free, need, rate = self.usage(directory)
+            except OSError:
+                continue
+            disk_free.set(free, path=directory)
+            disk_projected.set(need, path=directory)
+            headroom = max(free - self.min_free_space * GIB, 0)
+            disk_exhaustion.set(headroom / rate if rate else float("inf"), path=directory)
+
+
+storage = StorageMonitor()
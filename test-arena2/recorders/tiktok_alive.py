@@ -0,0 +1,87 @@
+import asyncio
+from typing import Dict
+
+import utils.config as config
+from utils.clients import clients
+from utils.utils import logutil
+
+
+class TikTokAlivePoller:
+    """Check every registered TikTok room in as few check_alive requests as possible."""
+
+    def __init__(self, client_key, interval=config.DEFAULT_INTERVAL, batch_size=config.DEFAULT_TIKTOK_ALIVE_BATCH_SIZE):
+        self.client_key = client_key
+        self.interval = interval
+        self.batch_size = batch_size
+        self.flag = "[TikTok][check_alive]"
+        self.rooms: Dict[str, asyncio.Event] = {}
+        # Last answer for each room, missing until check_alive has reported on it
+        self.answers: Dict[str, bool] = {}
+        self.requests = 0
+
+    def register(self, room_id) -> asyncio.Event:
+        room_id = str(room_id)
+        if room_id not in self.rooms:
+            self.rooms[room_id] = asyncio.Event()
+        return self.rooms[room_id]
+
+    def unregister(self, room_id):
+        self.rooms.pop(str(room_id), None)
+        self.answers.pop(str(room_id), None)
+
+    async def wait_alive(self, room_id, timeout):
+        """Return True once the room is alive, or on timeout False if it was reported not alive and None if unknown."""
+        event = self.register(room_id)
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            return self.answers.get(str(room_id))
+
+    async def check_alive(self, room_ids) -> Dict[str, bool]:
+        url = f"https://webcast.tiktok.com/webcast/room/check_alive/?aid=1988&room_ids={','.join(room_ids)}"
+        self.requests += 1
+        response = await clients.request(self.client_key, "GET", url, timeout=self.interval)
+        if response.status_code != 200:
+            logutil.error(self.flag, f"Failed to load the page. Status code: {response.status_code}")
+            return {}
+        if not response.content:
+            logutil.error(self.flag, "Response content is empty.")
+            return {}
+
+        response_json = response.json()
+        if response_json.get("status_code") != 0:
+            logutil.error(self.flag, f"Invalid status code: {response_json.get('status_code')}")
+            return {}
+
+        alive = {}
+        for data in response_json.get("data") or []:
+            room_id = data.get("room_id_str") or str(data.get("room_id"))
+            alive[room_id] = bool(data.get("alive"))
+        return alive
+
+    async def poll(self):
+        room_ids = list(self.rooms)
+        for i in range(0, len(room_ids), self.batch_size):
+            batch = room_ids[i : i + self.batch_size]
+            try:
+                alive = await self.check_alive(batch)
+            except Exception as e:
+                logutil.error(self.flag, f"Unexpected error: {e}")
+                continue
+            for room_id in batch:
+                event = self.rooms.get(room_id)
+                if event is None:
+                    continue
+                if room_id in alive:
+                    self.answers[room_id] = alive[room_id]
+                if alive.get(room_id):
+                    event.set()
+                else:
+                    event.clear()
+
+    async def start(self):
+        while True:
+            await self.poll()
+            logutil.debug(self.flag, f"rooms: {len(self.rooms)}, requests: {self.requests}")
+            await asyncio.sleep(self.interval)
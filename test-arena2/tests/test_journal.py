@@ -0,0 +1,25 @@
+import utils.config as config
+from recorders.journal import RecordingJournal
+
+URL = "https://chzzk.naver.com/live/channel"
+
+
+def make_journal(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, "DEFAULT_JOURNAL_DIR", str(tmp_path / "journal"))
+    journal = RecordingJournal("Chzzk", "channel", "[Chzzk][channel]")
+    output = tmp_path / "recording.ts"
+    output.write_bytes(b"\x47" * 188 * 10)
+    journal.begin(URL, "live-1", output, "2026.10.17 12.00.00", "title", "ts")
+    journal.checkpoint(output, None, 41, 188 * 10)
+    return journal
+
+
+def test_crashed_broadcast_is_resumed(tmp_path, monkeypatch):
+    journal = make_journal(tmp_path, monkeypatch)
+    entry = journal.resume(URL, "live-1")
+    assert (entry["sequence"], entry["offset"]) == (41, 188 * 10)
+
+
+def test_new_broadcast_on_the_same_channel_is_not_resumed(tmp_path, monkeypatch):
+    journal = make_journal(tmp_path, monkeypatch)
+    assert journal.resume(URL, "live-2") is None
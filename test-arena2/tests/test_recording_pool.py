@@ -0,0 +1,84 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import utils.config as config
+from recorders.recording_pool import RecordingPool
+from recorders.storage import storage
+
+
+def make_recorder(output):
+    return SimpleNamespace(flag="[Test][channel]", priority=config.DEFAULT_PRIORITY, output=str(output), secondary_output=None, current_output=str(output))
+
+
+@pytest.fixture
+def disk(monkeypatch):
+    # Simulated disk shortage, cleared by setting full to False
+    state = SimpleNamespace(full=True)
+    monkeypatch.setattr(storage, "check", lambda directory, extra=0: "disk full" if state.full else None)
+    return state
+
+
+def test_queued_recording_is_admitted_once_the_disk_frees_up(tmp_path, disk):
+    pool = RecordingPool()
+    pool.recheck_interval = 0.05
+    recorder = make_recorder(tmp_path)
+
+    async def run():
+        admission = asyncio.create_task(pool.admit(recorder))
+        await asyncio.sleep(0.1)
+        assert not admission.done()
+        assert (pool.active, len(pool.waiting)) == (0, 1)
+
+        # No other recording ends, the re-check alone has to admit it
+        disk.full = False
+        assert await asyncio.wait_for(admission, 1)
+        assert (pool.active, len(pool.waiting)) == (1, 0)
+        assert recorder.admission_wait > 0
+
+    asyncio.run(run())
+
+
+def test_queued_recording_is_rejected_after_the_admission_timeout(tmp_path, disk):
+    pool = RecordingPool()
+    pool.recheck_interval = 0.05
+    pool.admission_timeout = 0.2
+    recorder = make_recorder(tmp_path)
+
+    async def run():
+        assert not await asyncio.wait_for(pool.admit(recorder), 1)
+        assert (pool.active, len(pool.waiting)) == (0, 0)
+
+    asyncio.run(run())
+
+
+def test_load_is_only_checked_when_configured(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "check", lambda directory, extra=0: None)
+    monkeypatch.setattr(os, "getloadavg", lambda: (1000.0, 1000.0, 1000.0), raising=False)
+    pool = RecordingPool()
+
+    async def run():
+        assert pool.check_admission(str(tmp_path)) is None
+        pool.configure({config.KEY_MAX_LOAD: 2, config.KEY_ADMISSION: "reject"})
+        assert pool.check_admission(str(tmp_path))[0] == "cpu"
+        assert not await pool.admit(make_recorder(tmp_path))
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_leaves_the_queue(tmp_path, disk):
+    pool = RecordingPool()
+    pool.recheck_interval = 0.05
+    recorder = make_recorder(tmp_path)
+
+    async def run():
+        admission = asyncio.create_task(pool.admit(recorder))
+        await asyncio.sleep(0.1)
+        admission.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await admission
+        assert (pool.active, len(pool.waiting)) == (0, 0)
+
+    asyncio.run(run())
@@ -0,0 +1,87 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from recorders.registry import RecordingRegistry, RecordingState
+
+
+class FakeStream:
+    def __init__(self):
+        self.closed = threading.Event()
+
+    def close(self):
+        self.closed.set()
+
+
+def make_output():
+    output = SimpleNamespace(closed=False)
+    output.close = lambda: setattr(output, "closed", True)
+    return output
+
+
+def test_claim_refuses_a_second_detection():
+    registry = RecordingRegistry()
+    entry = registry.claim("url", "Chzzk", "channel")
+    assert registry.claim("url", "Chzzk", "channel") is None
+    registry.finish(entry)
+    assert "url" not in registry
+    assert registry.claim("url", "Chzzk", "channel")
+
+
+def test_invalid_transition_is_refused():
+    registry = RecordingRegistry()
+    entry = registry.claim("url", "Chzzk", "channel")
+    with pytest.raises(ValueError):
+        registry.set_state(entry, RecordingState.RECORDING)
+
+
+def test_cancelled_detection_leaves_the_recording_to_its_worker():
+    registry = RecordingRegistry()
+    entry = registry.claim("url", "Chzzk", "channel")
+    registry.set_state(entry, RecordingState.RESOLVING)
+    stream, output = FakeStream(), make_output()
+    recording = threading.Event()
+    finished = []
+
+    def worker():
+        assert registry.hand_over(entry)
+        try:
+            registry.set_state(entry, RecordingState.RECORDING, stream=stream, output=output)
+            recording.set()
+            stream.closed.wait(5)
+            finished.append(registry.set_state(entry, RecordingState.FINALIZING))
+        finally:
+            registry.release(entry, worker=True)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    assert recording.wait(5)
+
+    # What record() does when its task is cancelled on Ctrl+C, before the shutdown closes the recordings
+    registry.release(entry)
+    assert registry.in_state(RecordingState.RECORDING) == [entry]
+
+    registry.close_all()
+    thread.join(5)
+    assert stream.closed.is_set() and output.closed
+    assert finished == [True]
+    assert entry.state is None and "url" not in registry
+
+
+def test_worker_does_not_start_after_the_detection_gave_up():
+    registry = RecordingRegistry()
+    entry = registry.claim("url", "Chzzk", "channel")
+    registry.release(entry)
+    assert not registry.hand_over(entry)
+    assert len(registry) == 0
+
+
+def test_close_all_leaves_native_outputs_to_their_writer():
+    registry = RecordingRegistry()
+    entry = registry.claim("url", "Chzzk", "channel")
+    registry.set_state(entry, RecordingState.RESOLVING)
+    stream, output = FakeStream(), make_output()
+    registry.set_state(entry, RecordingState.RECORDING, stream=stream, output=output, native=True)
+    registry.close_all()
+    assert stream.closed.is_set() and not output.closed
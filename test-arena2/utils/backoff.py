@@ -0,0 +1,82 @@
+import threading
+from enum import IntEnum
+from typing import Dict
+
+import utils.config as config
+from utils.metrics import gauge
+from utils.utils import logutil
+
+breaker_state = gauge("recorder_circuit_breaker_state", "Circuit breaker state per channel and error class (0: closed, 1: open, 2: half-open)")
+
+
+class BreakerState(IntEnum):
+    """Enumeration that defines the states of a circuit breaker"""
+
+    CLOSED = 0
+    OPEN = 1
+    HALF_OPEN = 2
+
+
+class CircuitBreaker:
+    """Back off a channel per error class, and stop retrying at the normal pace after repeated failures."""
+
+    def __init__(self, flag, channel, interval, threshold=config.DEFAULT_BREAKER_THRESHOLD, max_delay=config.DEFAULT_BREAKER_MAX_DELAY):
+        self.flag = flag
+        self.channel = channel
+        self.interval = interval
+        self.threshold = threshold
+        self.max_delay = max(max_delay, interval)
+        self.lock = threading.Lock()
+        self.failures: Dict[str, int] = {}
+        self.trips: Dict[str, int] = {}
+        self.states: Dict[str, BreakerState] = {}
+
+    def state(self, error) -> BreakerState:
+        return self.states.get(self.error_class(error), BreakerState.CLOSED)
+
+    def error_class(self, error) -> str:
+        return error if isinstance(error, str) else type(error).__name__
+
+    def set_state(self, name, state):
+        self.states[name] = state
+        # Only failing channels have a series, so the label set stays small with many channels
+        if state == BreakerState.CLOSED:
+            breaker_state.remove(channel=self.channel, error=name)
+        else:
+            breaker_state.set(int(state), channel=self.channel, error=name)
+
+    def before_attempt(self):
+        # The first attempt after an open delay is the re-probe
+        with self.lock:
+            for name, state in self.states.items():
+                if state == BreakerState.OPEN:
+                    self.set_state(name, BreakerState.HALF_OPEN)
+
+    def record_failure(self, error) -> float:
+        """Return the number of seconds to wait before the next attempt."""
+        name = self.error_class(error)
+        with self.lock:
+            self.failures[name] = self.failures.get(name, 0) + 1
+            state = self.states.get(name, BreakerState.CLOSED)
+            if state == BreakerState.CLOSED and self.failures[name] < self.threshold:
+                return self.interval
+
+            self.trips[name] = self.trips.get(name, 0) + 1
+            delay = min(self.interval * 2 ** self.trips[name], self.max_delay)
+            self.set_state(name, BreakerState.OPEN)
+
+        if state == BreakerState.CLOSED:
+            logutil.warning(self.flag, f"Circuit breaker opened after {self.failures[name]} {name} failures. Retrying in {delay:g} seconds.")
+        else:
+            logutil.info(self.flag, f"Re-probe failed with {name}. Retrying in {delay:g} seconds.")
+        return delay
+
+    def record_success(self):
+        with self.lock:
+            opened = [name for name, state in self.states.items() if state != BreakerState.CLOSED]
+            for name in opened:
+                self.set_state(name, BreakerState.CLOSED)
+            self.failures.clear()
+            self.trips.clear()
+        for name in opened:
+            logutil.info(self.flag, f"Circuit breaker closed for {name}.")
@@ -0,0 +1,35 @@
+import time
+from typing import Dict, Tuple
+
+from utils.metrics import counter
+
+cache_hits = counter("cache_hits_total", "Cache lookups answered from the cache")
+cache_misses = counter("cache_misses_total", "Cache lookups that missed or had expired")
+
+
+class TTLCache:
+    """Dictionary whose entries expire after a fixed number of seconds."""
+
+    def __init__(self, name, ttl):
+        self.name = name
+        self.ttl = ttl
+        self.items: Dict[str, Tuple[float, object]] = {}
+
+    def get(self, key, default=None):
+        item = self.items.get(key)
+        if item and item[0] > time.monotonic():
+            cache_hits.inc(cache=self.name)
+            return item[1]
+        self.items.pop(key, None)
+        cache_misses.inc(cache=self.name)
+        return default
+
+    def set(self, key, value, ttl=None):
+        self.items[key] = (time.monotonic() + (ttl if ttl is not None else self.ttl), value)
+
+    def remaining(self, key) -> float:
+        item = self.items.get(key)
+        return max(item[0] - time.monotonic(), 0) if item else 0
+
+    def invalidate(self, key):
+        self.items.pop(key, None)
@@ -0,0 +1,165 @@
+from contextlib import asynccontextmanager
+from typing import Dict, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+from anyio import EndOfStream
+from httpx_socks import AsyncProxyTransport
+
+import utils.config as config
+from utils.metrics import counter
+from utils.ratelimit import limiter
+from utils.utils import logutil
+
+http_requests = counter("http_requests_total", "HTTP requests sent through the shared clients")
+http_connections = counter("http_connections_opened_total", "TCP connections opened by the shared clients")
+http_handshakes = counter("http_tls_handshakes_total", "TLS handshakes performed by the shared clients")
+http_errors = counter("http_connection_errors_total", "Connection errors per host")
+http_rebuilds = counter("http_client_rebuilds_total", "Connection pools to a host dropped after repeated connection errors")
+
+CONNECTION_ERRORS = (httpx.TransportError, EndOfStream)
+
+
+def freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((str(k), str(v)) for k, v in value.items()))
+    return value
+
+
+class ClientRegistry:
+    """Process-wide HTTP/2 clients shared by every recorder with the same proxy, headers and cookies.
+
+    Each host gets its own client, so the connections to a failing host can be dropped without touching the
+    requests other channels have in flight to other hosts. A dropped client is closed once its last request ends.
+    """
+
+    def __init__(self, error_threshold=config.DEFAULT_CLIENT_ERROR_THRESHOLD):
+        self.error_threshold = error_threshold
+        self.clients: Dict[Tuple, httpx.AsyncClient] = {}
+        self.options: Dict[Tuple, dict] = {}
+        self.errors: Dict[Tuple, int] = {}
+        self.in_flight: Dict[httpx.AsyncClient, int] = {}
+        self.retired = set()
+
+    def make_key(self, proxy, headers, cookies) -> Tuple:
+        key = (proxy, freeze(headers), freeze(cookies))
+        if key not in self.options:
+            self.options[key] = {"proxy": proxy, "headers": headers, "cookies": cookies}
+        return key
+
+    def get(self, key, host=None) -> httpx.AsyncClient:
+        if (key, host) not in self.clients:
+            self.clients[(key, host)] = self.create(**self.options[key])
+        return self.clients[(key, host)]
+
+    @asynccontextmanager
+    async def use(self, key, host):
+        client = self.get(key, host)
+        self.in_flight[client] = self.in_flight.get(client, 0) + 1
+        try:
+            yield client
+        finally:
+            self.in_flight[client] -= 1
+            if not self.in_flight[client]:
+                del self.in_flight[client]
+                if client in self.retired:
+                    self.retired.discard(client)
+                    await client.aclose()
+
+    def create(self, proxy, headers, cookies) -> httpx.AsyncClient:
+        client_kwargs = {
+            "http2": True,
+            "timeout": config.DEFAULT_INTERVAL,
+            "limits": httpx.Limits(max_connections=config.DEFAULT_CLIENT_MAX_CONNECTIONS, keepalive_expiry=config.DEFAULT_CLIENT_KEEPALIVE_EXPIRY),
+            "headers": headers,
+            "cookies": cookies,
+        }
+        # Check if a proxy is set
+        if proxy:
+            if "socks" in proxy:
+                client_kwargs["transport"] = AsyncProxyTransport.from_url(proxy, http2=True)
+            else:
+                client_kwargs["proxies"] = proxy
+        return httpx.AsyncClient(**client_kwargs)
+
+    def tracer(self, host):
+        async def trace(event_name, info):
+            if event_name == "connection.connect_tcp.complete":
+                http_connections.inc(host=host)
+            elif event_name == "connection.start_tls.complete":
+                http_handshakes.inc(host=host)
+
+        return trace
+
+    async def request(self, key, method, url, priority=config.DEFAULT_PRIORITY, rate_limit=True, **kwargs):
+        host = urlsplit(url).hostname
+        extensions = kwargs.pop("extensions", {})
+        extensions["trace"] = self.tracer(host)
+        if rate_limit:
+            await limiter.acquire(host, priority)
+        http_requests.inc(host=host)
+        try:
+            async with self.use(key, host) as client:
+                response = await client.request(method, url, extensions=extensions, **kwargs)
+        except CONNECTION_ERRORS:
+            await self.record_error(key, host)
+            raise
+        self.errors.pop((key, host), None)
+        if rate_limit:
+            limiter.observe(host, response)
+        return response
+
+    @asynccontextmanager
+    async def stream(self, key, method, url, priority=config.DEFAULT_PRIORITY, rate_limit=True, **kwargs):
+        host = urlsplit(url).hostname
+        extensions = kwargs.pop("extensions", {})
+        extensions["trace"] = self.tracer(host)
+        if rate_limit:
+            await limiter.acquire(host, priority)
+        http_requests.inc(host=host)
+        try:
+            async with self.use(key, host) as client:
+                async with client.stream(method, url, extensions=extensions, **kwargs) as response:
+                    if rate_limit:
+                        limiter.observe(host, response)
+                    yield response
+        except CONNECTION_ERRORS:
+            await self.record_error(key, host)
+            raise
+        self.errors.pop((key, host), None)
+
+    async def record_error(self, key, host):
+        # A single broken connection is dropped by the pool; only drop the host's connections after repeated failures
+        http_errors.inc(host=host)
+        self.errors[(key, host)] = self.errors.get((key, host), 0) + 1
+        if self.errors[(key, host)] < self.error_threshold:
+            return
+
+        logutil.warning(f"Dropping connections to {host} after {self.errors.pop((key, host))} connection errors.")
+        http_rebuilds.inc(host=host)
+        client = self.clients.pop((key, host), None)
+        if not client:
+            return
+        # Requests still using the old client finish on it, the last one closes it
+        if client in self.in_flight:
+            self.retired.add(client)
+        else:
+            await client.aclose()
+
+    def report(self):
+        logutil.info(f"HTTP clients: {len(self.clients)}")
+        for labels, requests in sorted(http_requests.items()):
+            host = dict(labels).get("host")
+            connections = http_connections.get(host=host)
+            handshakes = http_handshakes.get(host=host)
+            reuse = 1 - connections / requests if requests else 0
+            logutil.info(f"{host}: requests: {requests}, connections: {connections}, TLS handshakes: {handshakes}, reuse: {reuse:.1%}")
+
+    async def aclose(self):
+        for client in [*self.clients.values(), *self.retired]:
+            await client.aclose()
+        self.clients.clear()
+        self.retired.clear()
+
+
+clients = ClientRegistry()
@@ -12,6 +12,34 @@ KEY_COOKIES = "cookies"
 KEY_HEADERS = "headers"
 KEY_GROUPS = "groups"
 KEY_USERS = "users"
+KEY_MIN_INTERVAL = "min_interval"
+KEY_MAX_INTERVAL = "max_interval"
+KEY_JITTER = "jitter"
+KEY_PRIORITY = "priority"
+KEY_MAX_RECORDINGS = "max_recordings"
+KEY_BANDWIDTH_LIMIT = "bandwidth_limit"
+KEY_MIN_FREE_SPACE = "min_free_space"
+KEY_ADMISSION = "admission"
+KEY_SPACE_HORIZON = "space_horizon"
+KEY_ADMISSION_TIMEOUT = "admission_timeout"
+KEY_MAX_LOAD = "max_load"
+KEY_POSTPROCESS_CONCURRENCY = "postprocess_concurrency"
+KEY_POSTPROCESS_ORDER = "postprocess_order"
+KEY_POSTPROCESS_NICE = "postprocess_nice"
+KEY_POSTPROCESS_IONICE = "postprocess_ionice"
+KEY_POSTPROCESS_QUEUE = "postprocess_queue"
+KEY_HLS_ENGINE = "hls_engine"
+KEY_HLS_EDGES = "hls_edges"
+KEY_HEDGE = "hedge"
+KEY_WRITE_BUFFER = "write_buffer"
+KEY_FSYNC = "fsync"
+KEY_FSYNC_EVERY = "fsync_every"
+KEY_PREALLOCATE = "preallocate"
+KEY_SEGMENT_TIME = "segment_time"
+KEY_SEGMENT_SIZE = "segment_size"
+KEY_LIVE_REMUX = "live_remux"
+KEY_SECONDARY_OUTPUT = "secondary_output"
+KEY_PIPE_BUFFER = "pipe_buffer"
 
 DEFAULT_NAME = None
 DEFAULT_INTERVAL = 10
@@ -24,3 +52,122 @@ DEFAULT_HEADERS_TIKTOK = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
     "Referer": "https://www.tiktok.com/",
 }
+
+# Define required keys
+REQUIRED_GLOBAL_KEYS = [KEY_INTERVAL, KEY_FORMAT, KEY_OUTPUT, KEY_PROXY, KEY_COOKIES, KEY_HEADERS, KEY_GROUPS]
+REQUIRED_GROUP_KEYS = [KEY_PLATFORM, KEY_USERS]
+REQUIRED_USER_KEYS = [KEY_ID]
+
+# Define keys for merging options
+GLOBAL_KEYS = [KEY_PLATFORM, KEY_INTERVAL, KEY_FORMAT, KEY_OUTPUT, KEY_PROXY, KEY_COOKIES, KEY_HEADERS, KEY_MIN_INTERVAL, KEY_MAX_INTERVAL, KEY_JITTER, KEY_PRIORITY, KEY_HLS_ENGINE, KEY_HLS_EDGES, KEY_HEDGE, KEY_WRITE_BUFFER, KEY_FSYNC, KEY_FSYNC_EVERY, KEY_PREALLOCATE, KEY_SEGMENT_TIME, KEY_SEGMENT_SIZE, KEY_LIVE_REMUX, KEY_PIPE_BUFFER, KEY_SECONDARY_OUTPUT]
+USER_KEYS = [KEY_PLATFORM, KEY_ID, KEY_NAME, KEY_INTERVAL, KEY_FORMAT, KEY_OUTPUT, KEY_PROXY, KEY_COOKIES, KEY_HEADERS, KEY_MIN_INTERVAL, KEY_MAX_INTERVAL, KEY_JITTER, KEY_PRIORITY, KEY_HLS_ENGINE, KEY_HLS_EDGES, KEY_HEDGE, KEY_WRITE_BUFFER, KEY_FSYNC, KEY_FSYNC_EVERY, KEY_PREALLOCATE, KEY_SEGMENT_TIME, KEY_SEGMENT_SIZE, KEY_LIVE_REMUX, KEY_PIPE_BUFFER, KEY_SECONDARY_OUTPUT]
+
+# Multi-channel runner
+DEFAULT_CONFIG = "config.json"
+DEFAULT_MEMORY_REPORT_INTERVAL = 0
+DEFAULT_METRICS_PORT = 0  # Port of the Prometheus metrics endpoint, 0 to disable
+DEFAULT_METRICS_HOST = "127.0.0.1"
+DEFAULT_METRICS_TIMEOUT = 5
+
+# TikTok batched liveness checks
+DEFAULT_TIKTOK_ALIVE_BATCH_SIZE = 50
+DEFAULT_TIKTOK_ROOM_ID_TTL = 300
+DEFAULT_TIKTOK_OFFLINE_ROOM_ID_TTL = 30  # Seconds between profile lookups while a channel has no live room
+
+# Adaptive polling
+DEFAULT_MIN_INTERVAL = 5
+DEFAULT_MAX_INTERVAL = 120
+DEFAULT_JITTER = 0.1
+DEFAULT_IDLE_BACKOFF = 3600  # Seconds offline for the interval to grow by one base interval
+DEFAULT_HOT_SHARE = 0.05  # Share of past starts around an hour of the week to poll at the minimum interval
+DEFAULT_HISTORY_DIR = "history"
+DEFAULT_HISTORY_SIZE = 200
+
+# Backoff and circuit breaker for repeated failures
+DEFAULT_BREAKER_THRESHOLD = 5
+DEFAULT_BREAKER_MAX_DELAY = 1800
+
+# Shared HTTP clients
+DEFAULT_CLIENT_ERROR_THRESHOLD = 3  # Consecutive connection errors to a host before its connections are dropped
+DEFAULT_CLIENT_KEEPALIVE_EXPIRY = 60
+DEFAULT_CLIENT_MAX_CONNECTIONS = 100
+
+# Blocking work and event loop monitoring
+DEFAULT_BLOCKING_WORKERS = 8
+DEFAULT_LOOP_LAG_INTERVAL = 0.5
+DEFAULT_LOOP_LAG_WARNING = 1.0
+
+# Recording pool and admission control
+DEFAULT_PRIORITY = 0  # Lower values are admitted first when recordings are queued
+DEFAULT_MAX_RECORDINGS = 64
+DEFAULT_BANDWIDTH_LIMIT = 0  # Mbps, 0 for no limit
+DEFAULT_BITRATE_ESTIMATE = 8  # Mbps assumed per recording
+DEFAULT_MIN_FREE_SPACE = 0  # GiB to keep free, 0 to disable
+DEFAULT_SPACE_HORIZON = 0  # Seconds of recording the free space must cover, 0 to disable
+DEFAULT_BITRATE_SAMPLE_TIME = 30  # Seconds a recording runs before its bitrate is measured
+DEFAULT_MAX_LOAD = 0  # Load average per CPU, 0 to disable
+DEFAULT_ADMISSION = "queue"
+DEFAULT_ADMISSION_TIMEOUT = 1800  # Seconds a queued recording waits before it is rejected
+DEFAULT_ADMISSION_RECHECK_INTERVAL = 15  # Seconds between re-checks of the resources a queued recording waits for
+ADMISSION_CHOICES = ["queue", "reject"]
+POOL_KEYS = [KEY_MAX_RECORDINGS, KEY_BANDWIDTH_LIMIT, KEY_MIN_FREE_SPACE, KEY_ADMISSION, KEY_SPACE_HORIZON, KEY_ADMISSION_TIMEOUT, KEY_MAX_LOAD]
+
+# Post-processing queue
+DEFAULT_POSTPROCESS_QUEUE = "postprocess.json"
+DEFAULT_POSTPROCESS_CONCURRENCY = 1
+DEFAULT_POSTPROCESS_ORDER = "oldest"
+POSTPROCESS_ORDER_CHOICES = ["oldest", "smallest"]
+DEFAULT_POSTPROCESS_NICE = 10  # Added to the niceness of ffmpeg, 0 to keep the default
+DEFAULT_POSTPROCESS_IONICE = 2  # ionice class: 2 (best-effort, lowest level) or 3 (idle), 0 to disable
+POSTPROCESS_KEYS = [KEY_POSTPROCESS_CONCURRENCY, KEY_POSTPROCESS_ORDER, KEY_POSTPROCESS_NICE, KEY_POSTPROCESS_IONICE, KEY_POSTPROCESS_QUEUE]
+
+# Request rate limits per host, in requests per second
+DEFAULT_RATE_LIMIT = 10
+DEFAULT_RATE_LIMITS = {
+    "live.afreecatv.com": 10,
+    "api.chzzk.naver.com": 5,
+    "www.tiktok.com": 2,
+    "webcast.tiktok.com": 5,
+    "api.pandalive.co.kr": 5,
+}
+DEFAULT_MIN_RATE_LIMIT = 0.1
+DEFAULT_RATE_LIMIT_DECREASE = 0.5  # Multiplier applied on 403/429
+DEFAULT_RATE_LIMIT_INCREASE = 0.01  # Share of the configured rate recovered per successful response
+RATE_LIMITED_STATUS_CODES = [403, 429]
+
+# Streamlink sessions
+DEFAULT_SESSION_POOL = True  # Set to False to build a new session per lookup, e.g. to compare resolution latency
+DEFAULT_STREAMLINK_OPTIONS = {"stream-segment-timeout": 60, "hls-segment-queue-threshold": 10}
+
+# Native HLS engine
+DEFAULT_HLS_ENGINE = "streamlink"
+HLS_ENGINE_CHOICES = ["streamlink", "native"]
+DEFAULT_HLS_PREFETCH = 3  # Segments downloaded in parallel ahead of the writer
+DEFAULT_HLS_SEGMENT_TIMEOUT = 60  # Seconds without a new segment before the broadcast is considered over
+DEFAULT_HLS_RETRIES = 3
+DEFAULT_DEDUP_WINDOW = 64  # Content hashes of recent segments kept per broadcast
+DEFAULT_DEDUP_MAX_AGE = 600  # Seconds after which a reconnect is treated as a new broadcast
+DEFAULT_HEDGE = True  # Duplicate slow segment downloads to an alternate edge when one is known
+DEFAULT_HEDGE_PERCENTILE = 0.9  # Segment latency percentile after which a download is hedged
+DEFAULT_HEDGE_WINDOW = 50  # Recent segment latencies kept for the percentile
+DEFAULT_HEDGE_MIN_SAMPLES = 5
+DEFAULT_HEDGE_MIN_DELAY = 0.5
+DEFAULT_EDGE_SWITCH_MARGIN = 0.2  # An edge must be 20% faster than the current one to take over
+
+# Recording output
+DEFAULT_WRITE_BUFFER = 8  # MiB buffered per recording before writing
+DEFAULT_FSYNC = "never"
+FSYNC_CHOICES = ["never", "size", "time"]
+DEFAULT_FSYNC_EVERY = 64  # MiB for the "size" policy, seconds for the "time" policy
+DEFAULT_PREALLOCATE = 256  # MiB reserved ahead of the write position, 0 to disable
+DEFAULT_SEGMENT_TIME = 0  # Minutes per output part, 0 to disable
+DEFAULT_SEGMENT_SIZE = 0  # GiB per output part, 0 to disable
+STREAM_FORMAT = "ts"  # Container of the recorded streams
+DEFAULT_LIVE_REMUX = False
+LIVE_REMUX_FORMATS = ["mp4", "flv"]
+DEFAULT_PIPE_BUFFER = 64  # MiB held in memory for ffmpeg before spilling to disk
+
+# Recording journal
+DEFAULT_JOURNAL_DIR = "journal"
+DEFAULT_JOURNAL_MAX_AGE = 600  # Seconds after which a leftover journal no longer resumes a recording
+MP4_FRAGMENT_FLAGS = "frag_keyframe+empty_moov+default_base_moof"
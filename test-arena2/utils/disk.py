@@ -0,0 +1,43 @@
+import ctypes
+import ctypes.util
+import os
+import platform
+
+FALLOC_FL_KEEP_SIZE = 1
+libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True) if platform.system() == "Linux" else None
+
+
+def get_drive_free_space(path):
+    """Return the free space of the drive holding path in bytes."""
+    if platform.system() == "Windows":
+        free_bytes = ctypes.c_ulonglong(0)
+        ctypes.windll.kernel32.GetDiskFreeSpaceExW(ctypes.c_wchar_p(str(path)), None, None, ctypes.pointer(free_bytes))
+        return free_bytes.value
+    else:
+        st = os.statvfs(path)
+        return st.f_bavail * st.f_frsize
+
+
+def can_reserve_space() -> bool:
+    return libc is not None and hasattr(libc, "fallocate")
+
+
+def reserve_space(fd, offset, length):
+    """Allocate disk blocks for a file without changing its size, so readers never see the reserved space.
+
+    Only Linux can do this; callers check can_reserve_space() first. Raises OSError if the file system refuses.
+    """
+    if libc.fallocate(fd, FALLOC_FL_KEEP_SIZE, ctypes.c_longlong(offset), ctypes.c_longlong(length)) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, os.strerror(errno))
+
+
+def get_file_allocated_size(file_path):
+    """Return the allocated size of the file in bytes."""
+    if platform.system() == "Windows":
+        return os.path.getsize(file_path)
+    else:
+        st = os.stat(file_path)
+        block_size = os.statvfs(file_path).f_frsize
+        allocated_size = ((st.st_size + block_size - 1) // block_size) * block_size
+        return allocated_size
@@ -0,0 +1,49 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import utils.config as config
+from utils.metrics import gauge, histogram
+from utils.utils import logutil
+
+loop_lag = histogram("event_loop_lag_seconds", "Delay of the event loop in waking a sleeping task", buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+loop_lag_max = gauge("event_loop_lag_max_seconds", "Largest event loop delay seen so far")
+
+# Bounded pool for CPU-heavy parsing and blocking plugin calls, separate from the recording threads
+executor = ThreadPoolExecutor(max_workers=config.DEFAULT_BLOCKING_WORKERS, thread_name_prefix="blocking")
+
+
+async def run_blocking(func, *args, **kwargs):
+    return await run_in(executor, func, *args, **kwargs)
+
+
+async def run_in(pool, func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool, functools.partial(func, *args, **kwargs))
+
+
+def create_writer() -> ThreadPoolExecutor:
+    """A single thread for one recording's file I/O, so slow plugin calls on the blocking pool never hold up its writes."""
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="writer")
+
+
+class LoopLagMonitor:
+    """Measure how late the event loop wakes up a task that sleeps for a fixed interval."""
+
+    def __init__(self, interval=config.DEFAULT_LOOP_LAG_INTERVAL, warning=config.DEFAULT_LOOP_LAG_WARNING):
+        self.interval = interval
+        self.warning = warning
+        self.max_lag = 0
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - started - self.interval, 0)
+            loop_lag.observe(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+                loop_lag_max.set(lag)
+            if lag > self.warning:
+                logutil.warning(f"Event loop lagged {lag:.3f} seconds.")
@@ -0,0 +1,139 @@
+import threading
+from typing import Dict, Tuple
+
+DEFAULT_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.lock = threading.Lock()
+        self.values: Dict[Tuple, float] = {}
+
+    def key(self, labels) -> Tuple:
+        return tuple(sorted(labels.items()))
+
+    def get(self, **labels):
+        with self.lock:
+            return self.values.get(self.key(labels), 0)
+
+    def items(self):
+        with self.lock:
+            return list(self.values.items())
+
+    def remove(self, **labels):
+        with self.lock:
+            self.values.pop(self.key(labels), None)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self.key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self.key(labels)
+        with self.lock:
+            if key not in self.values:
+                # Per-bucket counts followed by the sum and the total count
+                self.values[key] = [0] * len(self.buckets) + [0, 0]
+            data = self.values[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def get(self, **labels):
+        with self.lock:
+            data = self.values.get(self.key(labels))
+            return list(data) if data else [0] * len(self.buckets) + [0, 0]
+
+
+registry: Dict[str, Metric] = {}
+registry_lock = threading.Lock()
+
+
+def get_or_create(cls, name, help, **kwargs):
+    with registry_lock:
+        if name not in registry:
+            registry[name] = cls(name, help, **kwargs)
+        return registry[name]
+
+
+def counter(name, help) -> Counter:
+    return get_or_create(Counter, name, help)
+
+
+def gauge(name, help) -> Gauge:
+    return get_or_create(Gauge, name, help)
+
+
+def histogram(name, help, buckets=DEFAULT_BUCKETS) -> Histogram:
+    return get_or_create(Histogram, name, help, buckets=buckets)
+
+
+def format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels) + "}"
+
+
+def render() -> str:
+    """Render every registered metric in the Prometheus text exposition format."""
+    lines = []
+    with registry_lock:
+        metrics = sorted(registry.values(), key=lambda metric: metric.name)
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        for labels, value in sorted(metric.items()):
+            if isinstance(metric, Histogram):
+                # Bucket counts are already cumulative
+                for bound, count in zip(metric.buckets + (float("inf"),), value[:-2] + [value[-1]]):
+                    lines.append(f"{metric.name}_bucket{format_labels(labels + (('le', format_value(bound)),))} {count}")
+                lines.append(f"{metric.name}_sum{format_labels(labels)} {format_value(value[-2])}")
+                lines.append(f"{metric.name}_count{format_labels(labels)} {value[-1]}")
+            else:
+                lines.append(f"{metric.name}{format_labels(labels)} {format_value(value)}")
+    return "\n".join(lines) + "\n"
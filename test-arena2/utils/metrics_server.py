@@ -0,0 +1,50 @@
+import asyncio
+
+import utils.config as config
+from utils.metrics import render
+from utils.utils import logutil
+
+
+class MetricsServer:
+    """Serve the metrics registry in the Prometheus text format over plain HTTP on the event loop.
+
+    Collectors are called before every scrape to refresh gauges derived from live state.
+    """
+
+    def __init__(self, port, host=config.DEFAULT_METRICS_HOST, collectors=()):
+        self.host = host
+        self.port = port
+        self.collectors = list(collectors)
+        self.server = None
+
+    async def handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), config.DEFAULT_METRICS_TIMEOUT)
+            # Skip the headers, nothing in them is used
+            while (await asyncio.wait_for(reader.readline(), config.DEFAULT_METRICS_TIMEOUT)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request.decode("latin-1").split()
+            if len(parts) < 2 or parts[0] != "GET":
+                status, body = "405 Method Not Allowed", b""
+            elif parts[1].split("?")[0] not in ("/", "/metrics"):
+                status, body = "404 Not Found", b""
+            else:
+                for collect in self.collectors:
+                    collect()
+                status, body = "200 OK", render().encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1") + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception as e:
+            logutil.error(f"Metrics request failed: {e}")
+        finally:
+            writer.close()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        logutil.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+        async with self.server:
+            await self.server.serve_forever()
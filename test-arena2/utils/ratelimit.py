@@ -0,0 +1,96 @@
+import asyncio
+import heapq
+import itertools
+import time
+from typing import Dict
+
+import utils.config as config
+from utils.metrics import gauge, histogram
+from utils.utils import logutil
+
+rate_limit_rate = gauge("rate_limit_requests_per_second", "Current request rate allowed per host")
+rate_limit_queue = gauge("rate_limit_queue_depth", "Requests waiting for a token per host")
+rate_limit_wait = histogram("rate_limit_wait_seconds", "Time requests waited for a token per host", buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60))
+
+
+class TokenBucket:
+    """Token bucket for one host; waiting requests are served by priority, lower values first."""
+
+    def __init__(self, host, rate):
+        self.host = host
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(rate, 1)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.waiting = []
+        self.sequence = itertools.count()
+        self.dispatcher = None
+        rate_limit_rate.set(self.rate, host=host)
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.tokens + (now - self.updated) * self.rate, self.burst)
+        self.updated = now
+
+    async def acquire(self, priority=0):
+        started = time.monotonic()
+        self.refill()
+        if not self.waiting and self.tokens >= 1:
+            self.tokens -= 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            heapq.heappush(self.waiting, (priority, next(self.sequence), waiter))
+            rate_limit_queue.set(len(self.waiting), host=self.host)
+            if not self.dispatcher or self.dispatcher.done():
+                self.dispatcher = asyncio.create_task(self.dispatch())
+            await waiter
+        rate_limit_wait.observe(time.monotonic() - started, host=self.host)
+
+    async def dispatch(self):
+        while self.waiting:
+            self.refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                continue
+            priority, sequence, waiter = heapq.heappop(self.waiting)
+            rate_limit_queue.set(len(self.waiting), host=self.host)
+            if waiter.done():
+                continue
+            self.tokens -= 1
+            waiter.set_result(None)
+
+    def observe(self, status_code, retry_after=None):
+        if status_code in config.RATE_LIMITED_STATUS_CODES:
+            rate = max(self.rate * config.DEFAULT_RATE_LIMIT_DECREASE, config.DEFAULT_MIN_RATE_LIMIT)
+            logutil.warning(f"{self.host} answered {status_code}. Lowering the request rate to {rate:.2f}/s.")
+            self.rate = rate
+            if retry_after:
+                # Spend the next retry_after seconds' worth of tokens up front
+                self.refill()
+                self.tokens = -retry_after * self.rate
+        elif self.rate < self.max_rate:
+            self.rate = min(self.rate + self.max_rate * config.DEFAULT_RATE_LIMIT_INCREASE, self.max_rate)
+        rate_limit_rate.set(self.rate, host=self.host)
+
+
+class RateLimiter:
+    """Process-wide token buckets keyed by host, shared by every recorder."""
+
+    def __init__(self):
+        self.buckets: Dict[str, TokenBucket] = {}
+
+    def get(self, host) -> TokenBucket:
+        if host not in self.buckets:
+            self.buckets[host] = TokenBucket(host, config.DEFAULT_RATE_LIMITS.get(host, config.DEFAULT_RATE_LIMIT))
+        return self.buckets[host]
+
+    async def acquire(self, host, priority=0):
+        await self.get(host).acquire(priority)
+
+    def observe(self, host, response):
+        retry_after = response.headers.get("Retry-After", "")
+        self.get(host).observe(response.status_code, float(retry_after) if retry_after.isdigit() else None)
+
+
+limiter = RateLimiter()
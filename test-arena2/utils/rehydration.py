@@ -0,0 +1,71 @@
+import re
+
+SCRIPT_MARKER = b'id="__UNIVERSAL_DATA_FOR_REHYDRATION__"'
+USER_MARKER = b'"userInfo"'
+SCRIPT_END = b"</script>"
+ROOM_ID_PATTERN = re.compile(rb'"roomId"\s*:\s*"(\d*)"')
+TAIL = 64  # Bytes kept between chunks so a marker split across chunks is still found
+
+FIND_SCRIPT = 0
+FIND_USER = 1
+FIND_ROOM_ID = 2
+
+
+class RoomIdExtractor:
+    """Find userInfo.user.roomId in a TikTok profile page while it is being downloaded.
+
+    Feed the body chunk by chunk; feed() returns True as soon as the answer is known so the
+    rest of the page does not need to be read. room_id stays None if the rehydration script
+    was never found, and is "" if the script has no room ID.
+    """
+
+    def __init__(self):
+        self.buffer = b""
+        self.state = FIND_SCRIPT
+        self.done = False
+        self.room_id = None
+        self.bytes_read = 0
+
+    def feed(self, chunk: bytes) -> bool:
+        if self.done:
+            return True
+        self.bytes_read += len(chunk)
+        self.buffer += chunk
+
+        if self.state == FIND_SCRIPT:
+            if not self.skip_to(SCRIPT_MARKER):
+                return False
+            self.state = FIND_USER
+
+        # Anything after the end of the script belongs to another tag
+        end = self.buffer.find(SCRIPT_END)
+        if self.state == FIND_USER:
+            index = self.buffer.find(USER_MARKER, 0, end if end >= 0 else len(self.buffer))
+            if index < 0:
+                return self.finish("") if end >= 0 else self.keep_tail()
+            self.buffer = self.buffer[index + len(USER_MARKER) :]
+            self.state = FIND_ROOM_ID
+            end = self.buffer.find(SCRIPT_END)
+
+        match = ROOM_ID_PATTERN.search(self.buffer, 0, end if end >= 0 else len(self.buffer))
+        if match:
+            return self.finish(match.group(1).decode())
+        return self.finish("") if end >= 0 else self.keep_tail()
+
+    def skip_to(self, marker) -> bool:
+        index = self.buffer.find(marker)
+        if index < 0:
+            self.keep_tail()
+            return False
+        self.buffer = self.buffer[index + len(marker) :]
+        return True
+
+    def keep_tail(self) -> bool:
+        self.buffer = self.buffer[-TAIL:]
+        return False
+
+    def finish(self, room_id) -> bool:
+        self.room_id = room_id
+        self.buffer = b""
+        self.done = True
+        return True
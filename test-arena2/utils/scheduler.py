@@ -0,0 +1,146 @@
+import json
+import os
+import random
+import time
+from array import array
+
+import utils.config as config
+from utils.metrics import counter, histogram
+from utils.utils import logutil
+
+HOURS_PER_WEEK = 7 * 24
+
+poll_requests = counter("recorder_poll_requests_total", "API requests made while polling for broadcasts")
+detection_latency = histogram("recorder_detection_latency_seconds", "Time from going live to being detected")
+
+
+def hour_of_week(timestamp) -> int:
+    local = time.localtime(timestamp)
+    return local.tm_wday * 24 + local.tm_hour
+
+
+def parse_started_at(value):
+    """Convert a platform's broadcast start time (epoch or local datetime string) to a timestamp."""
+    if not value:
+        return None
+    try:
+        if isinstance(value, (int, float)) or str(value).isdigit():
+            value = float(value)
+            # Some APIs report milliseconds
+            return value / 1000 if value > 1e11 else value
+        return time.mktime(time.strptime(str(value), "%Y-%m-%d %H:%M:%S"))
+    except (ValueError, OverflowError):
+        return None
+
+
+class AdaptiveScheduler:
+    """Choose the next poll interval of a channel from its broadcast history."""
+
+    def __init__(self, platform, id, user: dict, starts=None):
+        self.platform = platform
+        self.channel = f"{platform}/{id}"
+        self.interval = user.get(config.KEY_INTERVAL, config.DEFAULT_INTERVAL)
+        self.min_interval = min(user.get(config.KEY_MIN_INTERVAL, config.DEFAULT_MIN_INTERVAL), self.interval)
+        self.max_interval = max(user.get(config.KEY_MAX_INTERVAL, config.DEFAULT_MAX_INTERVAL), self.interval)
+        self.jitter = user.get(config.KEY_JITTER, config.DEFAULT_JITTER)
+        self.history_file = os.path.join(config.DEFAULT_HISTORY_DIR, f"{platform}_{id}.json")
+
+        self.live = None
+        self.detected_at = 0
+        self.last_poll = 0
+        self.last_change = time.time()
+        self.transitions = []
+        self.requests = 0
+        # The channel store keeps the start counts between recorders, the transitions are only read when they change
+        self.loaded = starts is None
+        self.starts = array("I", [0] * HOURS_PER_WEEK) if starts is None else starts
+        if self.loaded:
+            self.load_history()
+
+    def load_history(self, count=True):
+        try:
+            with open(self.history_file, "r", encoding="utf-8") as file:
+                self.transitions = json.load(file)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logutil.error(f"[{self.channel}] Failed to load broadcast history: {e}")
+            return
+        if not count:
+            return
+        for timestamp, live in self.transitions:
+            if live:
+                self.starts[hour_of_week(timestamp)] += 1
+
+    def save_history(self):
+        try:
+            os.makedirs(config.DEFAULT_HISTORY_DIR, exist_ok=True)
+            with open(self.history_file, "w", encoding="utf-8") as file:
+                json.dump(self.transitions, file)
+        except Exception as e:
+            logutil.error(f"[{self.channel}] Failed to save broadcast history: {e}")
+
+    def add_request(self):
+        self.requests += 1
+        poll_requests.inc(platform=self.platform)
+
+    def observe(self, live, started_at=None):
+        now = time.time()
+        if live:
+            self.detected_at = time.monotonic()
+        if live and self.live is False:
+            # Without a start time from the platform, the gap since the last poll is the upper bound
+            latency = now - started_at if started_at else now - self.last_poll
+            detection_latency.observe(max(latency, 0), platform=self.platform)
+        if live != self.live:
+            if not self.loaded:
+                self.loaded = True
+                self.load_history(count=False)
+            if live:
+                timestamp = started_at or now
+                self.starts[hour_of_week(timestamp)] += 1
+            else:
+                timestamp = now
+            if self.live is not None or live:
+                self.transitions.append((timestamp, live))
+                self.trim_history()
+                self.save_history()
+            self.live = live
+            self.last_change = now
+        self.last_poll = now
+
+    def trim_history(self):
+        while len(self.transitions) > config.DEFAULT_HISTORY_SIZE:
+            timestamp, live = self.transitions.pop(0)
+            if live:
+                self.starts[hour_of_week(timestamp)] -= 1
+
+    def is_hot(self, timestamp) -> bool:
+        total = sum(self.starts)
+        if not total:
+            return False
+        hour = hour_of_week(timestamp)
+        nearby = sum(self.starts[(hour + offset) % HOURS_PER_WEEK] for offset in (-1, 0, 1))
+        return nearby / total >= config.DEFAULT_HOT_SHARE
+
+    def seconds_until_hot(self, now, limit):
+        # Wake up at the start of the next hot hour instead of sleeping through it
+        next_hour = now - now % 3600 + 3600
+        while next_hour - now < limit:
+            if self.is_hot(next_hour):
+                return next_hour - now
+            next_hour += 3600
+        return limit
+
+    def next_interval(self):
+        now = time.time()
+        if self.live or not sum(self.starts):
+            interval = self.interval
+        elif self.is_hot(now):
+            interval = self.min_interval
+        else:
+            idle = now - self.last_change
+            interval = self.interval * (1 + idle / config.DEFAULT_IDLE_BACKOFF)
+            interval = self.seconds_until_hot(now, min(interval, self.max_interval))
+        interval = min(max(interval, self.min_interval), self.max_interval)
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
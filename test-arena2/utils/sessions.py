@@ -0,0 +1,66 @@
+import threading
+from typing import Dict, Tuple
+from urllib.parse import urlsplit
+
+import streamlink
+
+import utils.config as config
+from utils.clients import freeze
+from utils.metrics import counter
+
+plugin_cache_hits = counter("streamlink_plugin_cache_hits_total", "Plugin lookups answered from the cache")
+sessions_created = counter("streamlink_sessions_created_total", "Streamlink sessions created")
+
+
+class SessionPool:
+    """Streamlink sessions shared across polls and channels with the same proxy, headers and cookies."""
+
+    def __init__(self):
+        # Streams are resolved on executor threads
+        self.lock = threading.Lock()
+        self.sessions: Dict[Tuple, streamlink.session.Streamlink] = {}
+        self.plugins: Dict[Tuple, type] = {}
+
+    def create(self, proxy, headers, cookies) -> streamlink.session.Streamlink:
+        sessions_created.inc()
+        session = streamlink.session.Streamlink(config.DEFAULT_STREAMLINK_OPTIONS)
+        # Add streamlink's HTTP related options
+        if proxy:
+            # If the proxy is socks5, change the streamlink proxy parameter to socks5h to prevent some streams from failing to load
+            if "socks" in proxy:
+                proxy = proxy.replace("://", "h://")
+            session.set_option("http-proxy", proxy)
+        if headers:
+            session.set_option("http-headers", headers)
+        if cookies:
+            session.set_option("http-cookies", cookies)
+        return session
+
+    def get(self, proxy, headers, cookies) -> streamlink.session.Streamlink:
+        if not config.DEFAULT_SESSION_POOL:
+            return self.create(proxy, headers, cookies)
+        key = (proxy, freeze(headers), freeze(cookies))
+        with self.lock:
+            if key not in self.sessions:
+                self.sessions[key] = self.create(proxy, headers, cookies)
+            return self.sessions[key]
+
+    def pattern(self, url) -> Tuple:
+        # Every channel URL of a platform has the same host and first path segment
+        parts = urlsplit(url)
+        return parts.hostname, parts.path.strip("/").split("/")[0]
+
+    def streams(self, session, url):
+        key = (id(session), *self.pattern(url))
+        with self.lock:
+            pluginclass = self.plugins.get(key)
+        if not pluginclass:
+            pluginname, pluginclass, url = session.resolve_url(url)
+            with self.lock:
+                self.plugins[key] = pluginclass
+        else:
+            plugin_cache_hits.inc()
+        return pluginclass(session, url).streams()
+
+
+session_pool = SessionPool()
@@ -2,6 +2,8 @@ import argparse
 
 from loguru import logger
 
+import utils.config as config
+
 PLATFORM_CHOICES = [
     "Afreeca",
     "Chzzk",
@@ -31,6 +33,17 @@ def parse_args():
     return args_dict
 
 
+def parse_multi_args():
+    parser = argparse.ArgumentParser(description="Record every channel of a configuration file in a single process.")
+    parser.add_argument("config", type=str, nargs="?", default=config.DEFAULT_CONFIG, help="Path of the configuration file")
+    parser.add_argument("-m", "--memory-report", type=int, default=config.DEFAULT_MEMORY_REPORT_INTERVAL, help="Report memory per channel every N seconds (0 to disable)")
+    parser.add_argument("-M", "--metrics-port", type=int, default=config.DEFAULT_METRICS_PORT, help="Serve Prometheus metrics on this localhost port (0 to disable)")
+
+    args = parser.parse_args()
+
+    return vars(args)
+
+
 class Logger:
     def __init__(self):
         self.configure_logger()